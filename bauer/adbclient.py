@@ -0,0 +1,178 @@
+import re
+import time
+import logging
+import processrunner
+
+import error
+
+# Runs inside the device shell and returns as soon as the system reports that it has booted.
+BOOT_COMPLETED_SCRIPT = 'while [ "$(getprop sys.boot_completed)" != "1" ]; do sleep 0.2; done'
+
+# Runs inside the device shell and returns as soon as the package manager knows the package.
+PACKAGE_INSTALLED_SCRIPT = 'until pm path %s > /dev/null 2>&1; do sleep 0.2; done'
+
+# Runs inside the device shell and returns as soon as the process has exited.
+PROCESS_EXIT_SCRIPT = 'while [ -d /proc/%d ]; do sleep 0.2; done'
+
+# Asks the device how a process ended: the exit info of the activity manager (android 11 /
+# API 30 and later) and the crash log buffer (the only source on older devices).
+EXIT_INFO_SEPARATOR = "--- bauer exit info ---"
+EXIT_STATUS_SCRIPT = 'dumpsys activity exit-info %s 2>/dev/null; echo "' + EXIT_INFO_SEPARATOR + '"; logcat -d -b crash 2>/dev/null'
+
+# ApplicationExitInfo reasons for which the status is the exit code or a signal number
+EXIT_REASON_EXIT_SELF = "EXIT_SELF"
+EXIT_SIGNAL_REASONS = [ "SIGNALED", "CRASH_NATIVE" ]
+
+# ApplicationExitInfo reasons that mean that the app failed. Their status has no meaning.
+EXIT_FAILURE_REASONS = [ "CRASH", "ANR", "INITIALIZATION_FAILURE" ]
+
+# How often the local wait loops check their processes
+POLL_INTERVAL_SECONDS = 0.1
+
+# Returns the exit status that the activity manager recorded for the process with the given pid,
+# or None. The exit info also lists earlier processes of the package, so only the entry of
+# this very process is used.
+def parseExitInfo(output, pid):
+    for entry in output.split("ApplicationExitInfo #")[1:]:
+        if not re.search(r"\bpid=%d\b" % pid, entry):
+            continue
+
+        reasonMatch = re.search(r"\breason=\d+ \((\w+)\)", entry)
+        statusMatch = re.search(r"\bstatus=(\d+)", entry)
+        if reasonMatch is None or statusMatch is None:
+            return None
+
+        reason = reasonMatch.group(1)
+        status = int(statusMatch.group(1))
+        if reason == EXIT_REASON_EXIT_SELF:
+            return status
+        if reason in EXIT_SIGNAL_REASONS:
+            # like a shell reports processes that were killed by a signal
+            return 128 + status
+        if reason in EXIT_FAILURE_REASONS:
+            return 1
+        # low memory kills, user requests, ... say nothing about the app itself
+        return None
+
+    return None
+
+# Returns the exit status of the process with the given pid if it crashed according to the
+# crash log, or None.
+def parseCrashLog(output, packageName, pid):
+    # native crash: "Fatal signal 11 (SIGSEGV), code 1, fault addr 0x0 in tid 1234 (main), pid 1234 (io.boden...)"
+    match = re.search(r"Fatal signal (\d+) .*\bpid %d \(%s\)" % (pid, re.escape(packageName)), output)
+    if match:
+        return 128 + int(match.group(1))
+
+    # uncaught java exception: "Process: io.boden..., PID: 1234"
+    if re.search(r"Process: %s, PID: %d\b" % (re.escape(packageName), pid), output):
+        return 1
+
+    return None
+
+# Runs adb commands for one android device. If a serial (e.g. "emulator-5556") is given, then
+# every command is addressed to that device. Otherwise adb expects exactly one device.
+class AdbClient:
+    def __init__(self, adbPath, env, serial = None):
+        self.logger = logging.getLogger(__name__)
+        self.adbPath = adbPath
+        self.env = env
+        self.serial = serial
+
+    def getCommand(self, arguments):
+        if self.serial:
+            return [ self.adbPath, "-s", self.serial ] + list(arguments)
+        return [ self.adbPath ] + list(arguments)
+
+    # Waits until the device is online and has finished booting. Instead of polling the boot
+    # state with a new adb client every few seconds, a single adb process waits for the device
+    # to come online and then watches sys.boot_completed in one shell session.
+    #
+    # emulatorProcess: if given, then the wait is aborted when the emulator exits.
+    def waitForBoot(self, timeoutSeconds, emulatorProcess = None):
+        waitProcess = processrunner.start(self.getCommand([ "wait-for-device", "shell", BOOT_COMPLETED_SCRIPT ]), env=self.env, captureOutput=True)
+
+        timeoutTime = time.time() + timeoutSeconds
+        try:
+            while waitProcess.poll() is None:
+                if emulatorProcess is not None and emulatorProcess.poll() is not None:
+                    raise Exception("The android emulator exited with code %s while booting" % emulatorProcess.returncode)
+
+                if time.time() >= timeoutTime:
+                    raise error.ToolTimedOutError("android emulator boot", timeoutSeconds)
+
+                time.sleep(POLL_INTERVAL_SECONDS)
+        finally:
+            if waitProcess.poll() is None:
+                waitProcess.kill()
+                waitProcess.wait()
+
+        output = waitProcess.stdout.read().decode("utf-8", "replace").strip()
+        waitProcess.stdout.close()
+
+        if waitProcess.returncode != 0:
+            self.logger.debug("adb output: %s", output)
+            raise error.ToolFailedError("adb wait-for-device", waitProcess.returncode)
+
+    # Waits until the package manager lists the package.
+    def waitForPackage(self, packageName, timeoutSeconds):
+        processrunner.checkCall(self.getCommand([ "shell", PACKAGE_INSTALLED_SCRIPT % packageName ]), env=self.env, timeout=timeoutSeconds)
+
+    # Starts an activity and waits until it has been launched (am start -W). Returns the output of am.
+    def startActivity(self, component, extraArguments, timeoutSeconds):
+        output = processrunner.checkOutput(self.getCommand([ "shell", "am", "start", "-W", "-a", "android.intent.action.MAIN", "-n", component ] + list(extraArguments)), env=self.env, timeout=timeoutSeconds)
+
+        # am reports errors on stdout and still exits with 0
+        for line in output.splitlines():
+            if line.startswith("Error"):
+                raise Exception("Unable to start %s:\n%s" % (component, output.strip()))
+
+        return output
+
+    # Returns the pid of the process of a package, or None if the package is not running.
+    def getProcessId(self, packageName):
+        result = processrunner.run(self.getCommand([ "shell", "pidof", packageName ]), env=self.env, captureOutput=True)
+        pids = result.output.split() if result.exitCode == 0 else []
+        if not pids or not pids[0].isdigit():
+            return None
+        return int(pids[0])
+
+    # Blocks until the process has exited. The device shell watches the process, so this
+    # takes a single adb call no matter how long the process runs.
+    def waitForProcessExit(self, pid, timeoutSeconds):
+        result = processrunner.run(self.getCommand([ "shell", PROCESS_EXIT_SCRIPT % pid ]), env=self.env, timeout=timeoutSeconds)
+        if result.timedOut:
+            raise error.ToolTimedOutError("android app (pid %d)" % pid, timeoutSeconds)
+        processrunner.checkResult(result, timeoutSeconds)
+
+    # Returns the exit status of a process that has exited, or None if the device does not report it.
+    # pid can be None if the process exited before its pid was known. Then nothing can tell its
+    # exit apart from the ones of earlier runs, so None is returned.
+    def getExitStatus(self, packageName, pid):
+        if pid is None:
+            return None
+
+        result = processrunner.run(self.getCommand([ "shell", EXIT_STATUS_SCRIPT % packageName ]), env=self.env, captureOutput=True)
+        exitInfo, separator, crashLog = result.output.partition(EXIT_INFO_SEPARATOR)
+
+        status = parseExitInfo(exitInfo, pid)
+        if status is None:
+            status = parseCrashLog(crashLog, packageName, pid)
+        return status
+
+    # Sends a command to the emulator console (adb emu ...). The console answers with "OK"
+    # or with "KO: <reason>" and adb exits with 0 either way.
+    def emulatorConsole(self, arguments):
+        output = processrunner.checkOutput(self.getCommand([ "emu" ] + list(arguments)), env=self.env)
+        if output.strip().startswith("KO"):
+            raise Exception("Emulator console command '%s' failed: %s" % (" ".join(arguments), output.strip()))
+        return output
+
+    def saveSnapshot(self, name):
+        self.emulatorConsole([ "avd", "snapshot", "save", name ])
+
+    def loadSnapshot(self, name):
+        self.emulatorConsole([ "avd", "snapshot", "load", name ])
+
+    def killEmulator(self):
+        return processrunner.call(self.getCommand([ "emu", "kill" ]), env=self.env)
@@ -1,14 +1,18 @@
 import os, sys
 import logging
-import subprocess
+import processrunner
 import shutil
 
-from buildexecutor import BuildExecutor
 from androidstudioprojectgenerator import AndroidStudioProjectGenerator
-from cmake import CMake
 from gradle import Gradle
+from buildparallelism import BuildParallelism, getJobCount, getParallelismConfigureArguments
+from compilercache import findCompilerCache
+from androidsdkpackages import AndroidSdkPackages
+from androidsdklicenses import AndroidSdkLicenses
+from distutils.spawn import find_executable
 
 import error
+import profiler
 
 class AndroidExecutor:
     def __init__(self, buildExecutor, generatorInfo, sourceDirectory, buildFolder):
@@ -18,12 +22,20 @@ class AndroidExecutor:
         self.buildFolder = buildFolder
         self.buildExecutor = buildExecutor
         self.gradle = Gradle(sourceDirectory)
-        self.cmake = CMake()
+
+        # share the cmake instance of the build executor instead of locating cmake again
+        self.cmake = buildExecutor.cmake
 
         self.androidBuildApiVersion = "28"
         self.androidBuildToolsVersion = "28.0.2"
         self.androidEmulatorApiVersion = "28"
 
+        # set by prepareMake when the fast build profile uses a compiler cache
+        self.compilerCache = None
+
+        # the generator that prepareMake configured the build directory with
+        self.makeGeneratorName = None
+
     def buildTarget(self, configuration, args, target):
         androidAbi = self.getAndroidABIFromArch(configuration.arch)
         androidHome = self.getAndroidHome()
@@ -35,15 +47,22 @@ class AndroidExecutor:
             self.buildTargetMake(configuration, args, target)
 
     def buildTargetMake(self, configuration, args, target):
-        buildExecutor = BuildExecutor(self.generatorInfo, self.sourceDirectory, self.buildFolder)
-        buildExecutor.buildTarget(configuration, args, target)
+        compilerCache = self.compilerCache
+        if compilerCache is not None:
+            statisticsBefore = compilerCache.getStatistics()
+
+        # the fast build profile uses a different generator than the one that belongs to the build system
+        self.buildExecutor.buildTarget(configuration, args, target, self.makeGeneratorName)
+
+        if compilerCache is not None and target != "clean":
+            compilerCache.reportHitRate(statisticsBefore, compilerCache.getStatistics())
 
     def buildTargetAndroidStudio(self, configuration, args, target, androidAbi, androidHome, buildDir):
 
         gradlePath = self.gradle.getGradlePath()
         gradleWrapperPath = self.getBuildToolPath(buildDir, "gradlew")
 
-        arguments = ["\"" + gradleWrapperPath + "\""]
+        arguments = [gradleWrapperPath]
 
         if target == "clean":
             arguments += ["clean"]
@@ -53,11 +72,12 @@ class AndroidExecutor:
             else:
                 arguments += ["assembleDebug"]
 
+        arguments += BuildParallelism("AndroidStudio", None, getJobCount(args)).getGradleArguments()
+
         self.logger.debug("Starting: %s", arguments)
 
-        exitCode = subprocess.call(" ".join(arguments), shell=True, cwd=buildDir, env=self.getToolEnv());
-        if exitCode!=0:
-            raise error.ToolFailedError("%s" %(arguments), exitCode);
+        with profiler.span("gradle", "gradle", task=arguments[1]):
+            processrunner.checkCall(arguments, cwd=buildDir, env=self.getToolEnv())
 
     def build(self, configuration, args):
         self.buildTarget(configuration, args, None)
@@ -71,22 +91,21 @@ class AndroidExecutor:
         else:
             self.buildTarget(configuration, args, "package")
 
-    def prepare(self, platformState, configuration, args):
+    def prepare(self, platformState, configuration, args, forceConfigure = False):
         androidAbi = self.getAndroidABIFromArch(configuration.arch)
         androidHome = self.getAndroidHome()
 
-        self.prepareAndroidEnvironment(configuration, args.accept_terms)
+        with profiler.span("android.sdk", "sdk"):
+            self.prepareAndroidEnvironment(platformState, configuration, args.accept_terms)
 
         buildDir = self.buildFolder.getBuildDir(configuration)
 
         if configuration.buildsystem == "AndroidStudio":
-            self.prepareAndroidStudio(platformState, configuration, androidAbi, androidHome, buildDir)
+            self.prepareAndroidStudio(platformState, configuration, androidAbi, androidHome, buildDir, forceConfigure)
         else:
-            self.prepareMake(platformState, configuration, args, androidAbi, androidHome, buildDir)
-
-    def prepareMake(self, platformState, configuration, args, androidAbi, androidHome, cmakeBuildDir):
-        self.cmake.open(self.sourceDirectory, cmakeBuildDir, "Unix Makefiles")
+            self.prepareMake(platformState, configuration, args, androidAbi, androidHome, buildDir, forceConfigure)
 
+    def prepareMake(self, platformState, configuration, args, androidAbi, androidHome, cmakeBuildDir, forceConfigure):
         android_abi_arg = self.getAndroidABIFromArch(configuration.arch)
         if not android_abi_arg:
             raise error.InvalidArchitectureError("No target architecture specified. The architecture parameter is required for makefile build systems.")
@@ -111,6 +130,34 @@ class AndroidExecutor:
             cmakeArguments += ["-DCPACK_OUTPUT_FILE_PREFIX=%s" % (packageFolder)]
 
 
+        generatorName = "Unix Makefiles"
+        self.compilerCache = None
+
+        # The fast build profile is remembered for the build folder, so that later calls
+        # without --fast-build do not switch back and force a full rebuild.
+        if args.fast_build:
+            platformState.state["fast-build"] = True
+
+        if platformState.state.get("fast-build"):
+            generatorName = self.getFastBuildGeneratorName()
+
+            self.compilerCache = findCompilerCache()
+            if self.compilerCache is not None:
+                self.logger.info("Using compiler cache %s", self.compilerCache.executable)
+                cmakeArguments += self.compilerCache.getConfigureArguments()
+
+        cmakeArguments += getParallelismConfigureArguments(generatorName, getJobCount(args))
+
+        # cmake refuses to configure an existing build directory with a different generator
+        previousGeneratorName = platformState.state.get("android-make-generator")
+        if previousGeneratorName and previousGeneratorName != generatorName:
+            self.logger.info("Switching from '%s' to '%s'. Cleaning cmake cache.", previousGeneratorName, generatorName)
+            self.cleanCMakeCache(cmakeBuildDir)
+            forceConfigure = True
+
+        platformState.state["android-make-generator"] = generatorName
+        self.makeGeneratorName = generatorName
+
         self.logger.warning("Disabling examples and tests, as we cannot build apk's yet.")
 
         self.logger.debug("Starting configure ...")
@@ -118,17 +165,29 @@ class AndroidExecutor:
         self.logger.debug(" Output Directory: %s", cmakeBuildDir)
         self.logger.debug(" Config: %s", configuration.config)
         self.logger.debug(" Arguments: %s", cmakeArguments)
-        self.logger.debug(" Generator: %s", "Unix Makefiles")
+        self.logger.debug(" Generator: %s", generatorName)
 
-        self.cmake.configure(cmakeArguments)
+        self.cmake.configureIfNeeded(platformState, self.sourceDirectory, cmakeBuildDir, generatorName, cmakeArguments, forceConfigure)
 
-        pass
+    # Ninja has much faster no-op builds than make. It can only be used if cmake supports it
+    # and the ninja executable is installed.
+    def getFastBuildGeneratorName(self):
+        if "Ninja" in self.generatorInfo.generatorNames and find_executable("ninja"):
+            return "Ninja"
 
-    def prepareAndroidStudio(self, platformState, configuration, androidAbi, androidHome, buildDir):
-        gradlePath = self.gradle.getGradlePath()
+        self.logger.info("Ninja is not available, using make.")
+        return "Unix Makefiles"
 
-        self.gradle.stop()
+    def cleanCMakeCache(self, cmakeBuildDir):
+        cacheFile = os.path.join(cmakeBuildDir, "CMakeCache.txt")
+        if os.path.exists(cacheFile):
+            os.remove(cacheFile)
 
+        cmakeFilesDir = os.path.join(cmakeBuildDir, "CMakeFiles")
+        if os.path.isdir(cmakeFilesDir):
+            shutil.rmtree(cmakeFilesDir)
+
+    def prepareAndroidStudio(self, platformState, configuration, androidAbi, androidHome, buildDir, forceConfigure):
         tmpCMakeFolder = os.path.join(buildDir, "tmp-cmake-gen")
 
         makefile_android_abi = self.getAndroidABIFromArch(configuration.arch)
@@ -139,8 +198,6 @@ class AndroidExecutor:
             # used to build anything.
             makefile_android_abi = "x86"
 
-        self.cmake.open(self.sourceDirectory, tmpCMakeFolder, "Unix Makefiles")
-
         cmakeArguments = [ 
             "-DCMAKE_TOOLCHAIN_FILE=%s/ndk-bundle/build/cmake/android.toolchain.cmake" % (androidHome), 
             "-DCMAKE_SYSTEM_NAME=Android", 
@@ -155,17 +212,27 @@ class AndroidExecutor:
         self.logger.debug(" Arguments: %s", cmakeArguments)
         self.logger.debug(" Generator: %s", "Unix Makefiles")
 
-        self.cmake.configure(cmakeArguments)
+        reconfigured = self.cmake.configureIfNeeded(platformState, self.sourceDirectory, tmpCMakeFolder, "Unix Makefiles", cmakeArguments, forceConfigure)
+
+        # The generated projects only depend on the cmake configuration, so there is nothing to do
+        # if that is unchanged.
+        if not reconfigured and os.path.exists(os.path.join(buildDir, "settings.gradle")):
+            self.logger.info("Android Studio project is up to date.")
+            return
+
+        gradlePath = self.gradle.getGradlePath()
+
+        with profiler.span("gradle.stop", "gradle"):
+            self.gradle.stop()
 
-        cmakeConfigurations = self.cmake.codeModel["configurations"]
-        if len(cmakeConfigurations) != 1:
+        codeModelIndex = self.cmake.getCodeModelIndex()
+        if len(codeModelIndex.configurationNames) != 1:
             raise Exception("Number of configurations is not 1!")
 
-        targetDependencies = self.calculateDependencies(self.cmake.codeModel)
+        targetDependencies = self.calculateDependencies(codeModelIndex)
 
-        config = cmakeConfigurations[0]
         projects = []
-        for project in config["projects"]:
+        for project in codeModelIndex.getProjects():
             self.logger.debug("Found project: %s", project["name"])
             #projects += [project]
             targetNames = []
@@ -276,85 +343,50 @@ class AndroidExecutor:
 
         return path
 
-    def calculateDependencies(self, codeModel):
-        cmakeConfigurations = codeModel["configurations"]
-        if len(cmakeConfigurations) != 1:
+    def calculateDependencies(self, codeModelIndex):
+        if len(codeModelIndex.configurationNames) != 1:
             raise Exception("Number of configurations is not 1!")
 
-        config = cmakeConfigurations[0]
-        projects = []
-        artifacts = {}
-
-        for project in config["projects"]:
-            for target in project["targets"]:
-                if "artifacts" in target and target["type"] == "SHARED_LIBRARY" or target["type"] == "STATIC_LIBRARY":
-                    artifacts[target["name"]] = []
-                    for artifact in target["artifacts"]:
-                        artifacts[target["name"]] += [os.path.basename(artifact)]
-
-        dependencies = {}
+        return codeModelIndex.getLinkDependencies()
 
-        for project in config["projects"]:
-            for target in project["targets"]:
-                dependencies[target["name"]] = []
-                if "linkLibraries" in target:
-                    for depname, artifactList in artifacts.items():
-                        for artifact in artifactList:
-                            if artifact in target["linkLibraries"]:
-                              dependencies[target["name"]] += [ depname ]
-
-        return dependencies
-
-    def tryDetectAndroidCmakeComponentName(self, sdkManagerPath):
-
-        command = '"%s" --list' % (sdkManagerPath)
-        try:
-            output = subprocess.check_output( command, shell=True, env=self.getToolEnv(), universal_newlines=True )
-        except:
-            self.logger.warning("Failed to get Android SDK module list")
-            return None
-
-        last_cmake_component_name = None
-        for line in output.splitlines():
-            line = line.strip()
-            if line.startswith("cmake;"):
-                last_cmake_component_name = line.partition(" ")[0]
-
-        return last_cmake_component_name
-
-
-
-    def prepareAndroidEnvironment(self, configuration, accept_terms):
+    def prepareAndroidEnvironment(self, platformState, configuration, accept_terms):
         self.logger.info("Preparing android environment...")
         androidAbi = self.getAndroidABIFromArch(configuration.arch)
         androidHome = self.getAndroidHome()
         sdkManagerPath = self.getBuildToolPath(androidHome, "tools/bin/sdkmanager")
 
+        licenses = None
         if accept_terms:
             self.logger.info("Ensuring that all android license agreements are accepted ...")
 
-            licenseCall = subprocess.Popen( '"%s" --licenses' % sdkManagerPath, shell=True, env=self.getToolEnv(), stdin=subprocess.PIPE )
-
-            licenseInputData = ""
-            for i in range(100):
-                licenseInputData += "y\n"
-            licenseCall.communicate(licenseInputData.encode('utf-8'))
+            licenses = AndroidSdkLicenses(androidHome, sdkManagerPath, self.getToolEnv())
+            if licenses.areAccepted(platformState.state.get("android-licenses")):
+                self.logger.info("All android license agreements are already accepted.")
+                accepted = True
+            else:
+                accepted = licenses.accept()
 
-            self.logger.info("Done updating licenses.")
+            # only remember the license files if the licenses were really accepted. Otherwise
+            # the next prepare would take them for accepted and never ask sdkmanager again.
+            acceptedLicenses = licenses.getAcceptedLicenses()
+            if accepted or licenses.hasRequiredLicenses(acceptedLicenses):
+                platformState.state["android-licenses"] = acceptedLicenses
+            else:
+                platformState.state.pop("android-licenses", None)
         
         self.logger.info("Ensuring that all necessary android packages are installed...")
 
-        sdkManagerCommand = '"%s" "platform-tools" "ndk-bundle" "extras;android;m2repository" "extras;google;m2repository" "build-tools;%s" "platforms;android-%s"' % (
-            sdkManagerPath,
-            self.androidBuildToolsVersion,
-            self.androidBuildApiVersion )
-
-        cmakeComponentName = self.tryDetectAndroidCmakeComponentName(sdkManagerPath);
-        if cmakeComponentName:
-            sdkManagerCommand += ' "%s"' % cmakeComponentName
+        sdkPackages = [
+            "platform-tools",
+            "ndk-bundle",
+            "extras;android;m2repository",
+            "extras;google;m2repository",
+            "build-tools;%s" % self.androidBuildToolsVersion,
+            "platforms;android-%s" % self.androidBuildApiVersion,
+            "cmake;*" ]
 
         try:
-            subprocess.check_call( sdkManagerCommand, shell=True, env=self.getToolEnv() )
+            AndroidSdkPackages(androidHome, sdkManagerPath, self.getToolEnv()).ensureInstalled(sdkPackages, licenses)
         except:
             self.logger.warning("Failed getting emulator, you will not be able to 'run' this configuration")
 
@@ -1,10 +1,27 @@
 import os
+import re
 import sys
-import subprocess
 import logging
-import time
 import random
-import tempfile
+import profiler
+import processrunner
+
+import error
+
+from androidsdkpackages import AndroidSdkPackages
+from androidsdklicenses import AndroidSdkLicenses
+from adbclient import AdbClient
+from emulatorpool import EmulatorPool, reserveConsolePort, releaseConsolePort
+
+# How long an app may run before the run is aborted, unless --run-android-timeout says otherwise
+DEFAULT_APP_TIMEOUT_SECONDS = 60 * 60
+
+# adb shell passes its arguments on to the shell inside the device, so the app parameters
+# have to be escaped for that shell. Commas separate the elements of --esa arrays, so
+# a comma inside a parameter is escaped for am first.
+def escapeAppParameter(param):
+    param = param.replace(",", "\\,")
+    return re.sub(r"([^A-Za-z0-9_\-.,:/=@%+{}])", r"\\\1", param)
 
 class AndroidRunner:
     def __init__(self, buildFolder, buildExecutor):
@@ -19,6 +36,8 @@ class AndroidRunner:
         self.sdkManagerPath = self.buildExecutor.getBuildToolPath(self.androidHome, "tools/bin/sdkmanager")
         self.emulatorPath = self.buildExecutor.getBuildToolPath(self.androidHome, "emulator/emulator")
 
+        self.adb = AdbClient(self.adbPath, self.androidEnvironment)
+
 
     def run(self, configuration, args):
 
@@ -35,51 +54,84 @@ class AndroidRunner:
         if not os.path.exists(moduleFilePath):
             raise Exception("APK not found - expected here: "+moduleFilePath)
         
+        with profiler.span("android.prepare", "emulator"):
+            self.prepareAndroid(androidAbi, args.accept_terms)
+
+        if args.emulator_pool:
+            return self.runInPooledEmulator(androidAbi, moduleFilePath, appIdToRun, args)
+
         deviceName = "bdnTestAVD"+str(random.getrandbits(32))
 
-        self.prepareAndroid(androidAbi)
-        deviceName = self.createEmulatorDevice(androidAbi, deviceName)
+        with profiler.span("emulator.create", "emulator"):
+            deviceName = self.createEmulatorDevice(androidAbi, deviceName)
+
+        # every run gets its own port pair, so that several runs can have emulators at the same time
+        port = reserveConsolePort()
+        self.adb = AdbClient(self.adbPath, self.androidEnvironment, "emulator-%d" % port)
 
         emulatorProcess = None
 
         try:
-            emulatorProcess = self.bootEmulator(deviceName, androidAbi)
-
-            self.installAppInEmulator(moduleFilePath)
-            self.startAppInEmulator(appIdToRun, args)
-            self.waitForAppToFinish(appIdToRun)
+            with profiler.span("emulator.boot", "emulator"):
+                emulatorProcess = self.bootEmulator(deviceName, androidAbi, port)
 
-            self.fetchOutput(args, appIdToRun)
+            exitCode = self.runApp(moduleFilePath, appIdToRun, args)
 
         finally:
             if emulatorProcess != None:
-                self.closeEmulator(deviceName, emulatorProcess)
+                with profiler.span("emulator.close", "emulator"):
+                    self.closeEmulator(deviceName, emulatorProcess)
+
+            releaseConsolePort(port)
 
             self.logger.info("Deleting virtual device for emulator...")
-            deleteDeviceCommand = '"%s" delete avd --name %s' % \
-            (   self.avdManagerPath,
-                deviceName )
+            processrunner.call( [self.avdManagerPath, "delete", "avd", "--name", deviceName], env=self.androidEnvironment )
+
+        return exitCode
+
+    def runInPooledEmulator(self, androidAbi, moduleFilePath, appIdToRun, args):
+        pool = EmulatorPool(self, args.emulator_pool, args.emulator_pool_idle_timeout)
 
-            subprocess.call(deleteDeviceCommand, shell=True, env=self.androidEnvironment )
+        with profiler.span("emulator.lease", "emulator"):
+            entry = pool.lease(androidAbi)
 
-        return 0
+        try:
+            self.adb = AdbClient(self.adbPath, self.androidEnvironment, entry["serial"])
+            return self.runApp(moduleFilePath, appIdToRun, args)
+        finally:
+            pool.release(entry)
+
+    # Installs and runs the app on the emulator and returns its exit code.
+    def runApp(self, moduleFilePath, appIdToRun, args):
+        with profiler.span("install", "emulator"):
+            self.installAppInEmulator(moduleFilePath, appIdToRun)
+
+        with profiler.span("app", "emulator", appId=appIdToRun):
+            self.startAppInEmulator(appIdToRun, args)
+            exitCode = self.waitForAppToFinish(appIdToRun, args.run_android_timeout or DEFAULT_APP_TIMEOUT_SECONDS)
+
+        self.fetchOutput(args, appIdToRun)
+
+        return exitCode
 
 
     def getEmulatorAbi(self, projectAbi):
         return "x86" if projectAbi is None else projectAbi
 
 
-    def prepareAndroid(self, androidAbi):
+    def prepareAndroid(self, androidAbi, acceptTerms):
         self.logger.info("Ensuring that all necessary android packages are installed (API Version: %s, ABI: %s)..." % (self.buildExecutor.androidEmulatorApiVersion, androidAbi) )
 
         emulatorAbi = self.getEmulatorAbi(androidAbi)
 
-        sdkManagerCommand = '"%s" "emulator" "system-images;android-%s;google_apis;%s"' % (
-            self.sdkManagerPath,
-            self.buildExecutor.androidEmulatorApiVersion,
-            emulatorAbi )
+        sdkPackages = [
+            "emulator",
+            "system-images;android-%s;google_apis;%s" % (self.buildExecutor.androidEmulatorApiVersion, emulatorAbi) ]
 
-        subprocess.check_call( sdkManagerCommand, shell=True, env=self.androidEnvironment )
+        # the system images need licenses of their own, which are accepted when their installation asks for them
+        licenses = AndroidSdkLicenses(self.androidHome, self.sdkManagerPath, self.androidEnvironment) if acceptTerms else None
+
+        AndroidSdkPackages(self.androidHome, self.sdkManagerPath, self.androidEnvironment).ensureInstalled(sdkPackages, licenses)
 
         self.logger.info("Done updating packages.")
 
@@ -91,44 +143,35 @@ class AndroidRunner:
 
         emulatorAbi = self.getEmulatorAbi(androidAbi)
 
-        createDeviceCommand = '"%s" create avd --name "%s" --force --abi google_apis/%s --package "system-images;android-%s;google_apis;%s"' % \
-            (   self.avdManagerPath,
-                deviceName,
-                emulatorAbi,
-                self.buildExecutor.androidEmulatorApiVersion,
-                emulatorAbi )
+        createDeviceCommand = [
+            self.avdManagerPath,
+            "create", "avd",
+            "--name", deviceName,
+            "--force",
+            "--abi", "google_apis/%s" % emulatorAbi,
+            "--package", "system-images;android-%s;google_apis;%s" % (self.buildExecutor.androidEmulatorApiVersion, emulatorAbi) ]
 
         # avdmanager will ask us wether we want to create a custom profile. We do not want that,
         # so we pipe a "no" into stdin
-        answerFile, answerFilePath = tempfile.mkstemp()
-        try:
-            os.write(answerFile, "no\n".encode("ascii"))
-            os.close(answerFile)
-
-            with open(answerFilePath, "r") as answerFile:
-                subprocess.check_call(createDeviceCommand, shell=True, stdin=answerFile, env=self.androidEnvironment)
-
-        finally:
-            os.remove(answerFilePath)
+        processrunner.checkCall(createDeviceCommand, input="no\n", env=self.androidEnvironment)
 
         return deviceName
 
-    def bootEmulator(self, deviceName, androidAbi):
-        self.logger.info("Starting emulator...");
-
+    # Returns the command that starts the emulator for a virtual device. If no console port
+    # is given, then the emulator picks the first free one.
+    def getEmulatorCommand(self, deviceName, port = None):
         gpuOption = "auto"
 
         # For some reason, GPU acceleration does not work inside a Parallels VM for linux.
         # "auto" will cause the emulator to exit with an error.
         if sys.platform.startswith("linux"):
-            try:
-                output = subprocess.check_output("lspci | grep VGA", shell=True, env=self.androidEnvironment, universal_newlines=True)
-                if output.find("Parallels")!=-1:
-                    self.logger.warning("Disabling GPU acceleration because we are running in a Parallels Desktop Linux VM.");
-                    gpuOption = "off"
-            except subprocess.CalledProcessError:
-                # if the lspci utility is not there then we simply assume that we are not in a parallels VM and do nothing.
-                pass
+            # if the lspci utility is not there then we simply assume that we are not in a parallels VM and do nothing.
+            result = processrunner.run(["lspci"], env=self.androidEnvironment, captureOutput=True)
+            if result.exitCode == 0:
+                for line in result.output.splitlines():
+                    if "VGA" in line and "Parallels" in line:
+                        self.logger.warning("Disabling GPU acceleration because we are running in a Parallels Desktop Linux VM.");
+                        gpuOption = "off"
 
         # Note: the -logcat parameter can be used to cause the android log
         # to be written to the process stdout. For example, "-logcat *:e" prints
@@ -138,98 +181,43 @@ class AndroidRunner:
         # to only use this parameter for specific log sources (also called "tags")
         # For example "-logcat myapp:w" would enable all messages with log level warning
         # or higher from the log source "myapp".
-        startEmulatorCommand = '"%s" -avd %s -gpu %s' % \
-            (   self.emulatorPath,
-                deviceName,
-                gpuOption )
+        command = [ self.emulatorPath, "-avd", deviceName, "-gpu", gpuOption ]
+        if port is not None:
+            command += [ "-port", str(port) ]
+        return command
+
+    def getBootTimeout(self, androidAbi):
+        # ARM emulators are REALLY slow. So we need a bigger timeout for them
+        if androidAbi is None or androidAbi.startswith("x86"):
+            return 120
+        return 600
+
+    def bootEmulator(self, deviceName, androidAbi, port):
+        self.logger.info("Starting emulator %s...", self.adb.serial);
 
         # the emulator process will not exit. So we just open it without
         # waiting.
-        if sys.platform == "win32":
-            emulatorProcess = subprocess.Popen(startEmulatorCommand, shell=False, env=self.androidEnvironment )
-        else:
-            emulatorProcess = subprocess.Popen(startEmulatorCommand, shell=True, env=self.androidEnvironment )
+        emulatorProcess = processrunner.start(self.getEmulatorCommand(deviceName, port), env=self.androidEnvironment )
 
-        # wait for the emulator  to finish booting (at most 60 seconds)
         self.logger.info("Waiting for android emulator to finish booting...");
-        # ARM emulators are REALLY slow. So we need a bigger timeout for them 
-        timeoutSeconds = 600
-        if androidAbi is None or androidAbi.startswith("x86"):
-            timeoutSeconds = 120
 
         self.logger.debug("Emulator pid: %s", emulatorProcess.pid)
 
-        timeoutTime = time.time()+timeoutSeconds
-        while True:
-            bootAnimStateCommand = '"%s" shell getprop init.svc.bootanim' % (self.adbPath)
-
-            # at first the command will fail, until the emulator process has initialized.
-            # Then we will get a proper output, that will not be "stopped" while we boot.
-            # Then, after the boot has completed, we will get "stopped"
-
-            try:
-                output = subprocess.check_output(bootAnimStateCommand, stderr=subprocess.STDOUT, shell=True, env=self.androidEnvironment, universal_newlines=True )                          
-                stateError = False
-            except subprocess.CalledProcessError as e:                            
-                output = e.output
-                stateError = True
-
-            output = output.strip()
-
-
-            if output == "" and not stateError:
-                # this happens between the "initializing" states and
-                # the boot starting-
-                emulatorState = "transitioning"
-
-            elif output=="running":
-                emulatorState = "booting"
+        self.adb.waitForBoot(self.getBootTimeout(androidAbi), emulatorProcess)
 
-            elif output=="stopped":
-                emulatorState = "boot finished"
-
-            elif output.find("no devices/emulators found")!=-1:
-                emulatorState = "initializing (no devices yet)"
-
-            elif output.find("device offline")!=-1:
-                emulatorState = "initializing (device not yet online)"
-
-            elif output.find("still connecting")!=-1:
-                emulatorState = "initializing (device connecting)"
-
-            else:
-                raise Exception("Unrecognized boot animation state output: "+output)
-
-            self.logger.debug("Emulator state: " + emulatorState)
-            
-            if emulatorState=="boot finished":
-                # done booting
-                break
-
-            # all other states indicate that either the emulator is still initializing
-            # or that the boot process has not finished yet.
-
-            if time.time()>=timeoutTime:
-                raise Exception("Android emulator did not finish booting within %d seconds. Last state output:\n%s" % (timeout_seconds, output) ) 
-
-            time.sleep(5)
-
-        self.logger.debug("Waiting 5 seconds...")
-        time.sleep(5)
+        self.logger.info("Emulator has finished booting.")
 
         return emulatorProcess
 
-    def installAppInEmulator(self, moduleFilePath):
+    def installAppInEmulator(self, moduleFilePath, appIdToRun):
         self.logger.info("Installing app in emulator...")
 
         # now install the app in the emulator
-        installAppCommand = '"%s" install -t "%s"' % \
-            (   self.adbPath,
-                moduleFilePath )
-        subprocess.check_call(installAppCommand, shell=True, env=self.androidEnvironment )
+        processrunner.checkCall(self.adb.getCommand([ "install", "-t", moduleFilePath ]), env=self.androidEnvironment )
 
-        self.logger.debug("Waiting 10 seconds...")
-        time.sleep(10)
+        # adb install returns when the package manager has accepted the package. Make sure
+        # that it is also listed before we try to start it.
+        self.adb.waitForPackage(appIdToRun, 60)
 
 
     def startAppInEmulator(self, appIdToRun, args):
@@ -238,7 +226,7 @@ class AndroidRunner:
         # and run the executable in the emulator
         appDataDirInEmulator = "/data/user/0/%s" % (appIdToRun)
 
-        runAppCommand = '"%s" shell am start -a android.intent.action.MAIN -n %s/io.boden.android.NativeRootActivity' % ( self.adbPath, appIdToRun )
+        extraArguments = []
 
         # we pass the commandline parameters as "extra" to the android app.
         # These can be accessed inside the app via "activity.getIntent().getExtras()".
@@ -247,53 +235,36 @@ class AndroidRunner:
         # Boden apps automatically look at the extras and try to find their commandline
         # arguments there.
         if len(args.params)>0:
-            param_array_string = ""
-            for param_index, param in enumerate(args.params):
-                # we want commas to end up as \, for the called app.
-                # For that we have to escape the backslash and the comma for the shell, so we need
-                # a double backslash, followed by backslash comma (so three backslashes and a comma)
-                # Because this is also a pythin string literal we need another backslash in fron of
-                # each backslash
-                param = param.replace(",", "\\\\\\,")
-                param = param.replace("\"", "\\\"")
-                param = param.replace("\'", "\\\'")
+            params = [ escapeAppParameter(param.replace("{DATA_DIR}", appDataDirInEmulator)) for param in args.params ]
 
-                param = param.replace("{DATA_DIR}", appDataDirInEmulator)
+            extraArguments += [ "--esa", "commandline-args", ",".join(params) ]
 
-                if param_index>0:
-                    param_array_string += "\\,"
-                param_array_string += param
-
-            runAppCommand += ' --esa commandline-args "%s"' % param_array_string
-
-        self.logger.debug("runAppCommand: %s", runAppCommand )
-        subprocess.check_call(runAppCommand, shell=True, env=self.androidEnvironment )
+        # -W waits until the activity has been launched, so the process is in the process list afterwards
+        output = self.adb.startActivity("%s/io.boden.android.NativeRootActivity" % appIdToRun, extraArguments, 60)
+        self.logger.debug("am start output:\n%s", output)
 
         self.logger.info("App successfully started.")
-        # give the process a chance to appear in the process list inside the emulator
-        time.sleep(2)
 
 
-    def waitForAppToFinish(self, appIdToRun):
+    # Returns the exit status of the app, or 0 if the device does not report one.
+    def waitForAppToFinish(self, appIdToRun, timeoutSeconds):
         self.logger.info("Waiting for app inside emulator to exit...")
 
-        while True:
-            getProcessListCommand = '"%s" shell ps' % ( self.adbPath )
-            procListOutput = subprocess.check_output(getProcessListCommand, shell=True, env=self.androidEnvironment, universal_newlines=True )
+        pid = self.adb.getProcessId(appIdToRun)
+        if pid is None:
+            self.logger.debug("App process is not running anymore")
+        else:
+            self.logger.debug("App pid: %d", pid)
+            self.adb.waitForProcessExit(pid, timeoutSeconds)
 
-            found_process = False
-            for line in procListOutput.splitlines():
-                line_words = line.split()
+        exitStatus = self.adb.getExitStatus(appIdToRun, pid)
 
-                if appIdToRun in str(line_words):
-                    found_process = True
-                    break
-            
-            if not found_process:
-                break
-            time.sleep(2)
+        if exitStatus is None:
+            self.logger.info("Process inside emulator has exited. The device does not report an exit status for it.")
+            return 0
 
-        self.logger.info("Process inside emulator has exited.")
+        self.logger.info("Process inside emulator has exited with status %d.", exitStatus)
+        return exitStatus
 
     def fetchOutput(self, args, appIdToRun):
         appDataDirInEmulator = "/data/user/0/%s" % (appIdToRun)
@@ -318,10 +289,10 @@ class AndroidRunner:
                 # denied when we try to access private data.
                 # Luckily we can use run-as instead
                 #pull_command = '"%s" pull "%s" "%s"' % ( self.adbPath, fromPath, temp_output_path )                                
-                readCommand = '"%s" shell run-as "%s" cat "%s"' % ( self.adbPath, appIdToRun, fromPath )
+                readCommand = self.adb.getCommand([ "shell", "run-as", appIdToRun, "cat", fromPath ])
                 
                 # if the file does not exist then the pull command will fail.
-                readExitCode = subprocess.call(readCommand, shell=True, stdout=readTargetFile, env=self.androidEnvironment )
+                readExitCode = processrunner.call(readCommand, stdout=readTargetFile, env=self.androidEnvironment )
 
                 if readExitCode!=0:
                     self.logger.warning("Output file inside emulator does not exist.")
@@ -333,8 +304,9 @@ class AndroidRunner:
     def closeEmulator(self, deviceName, emulatorProcess):
         self.logger.warning("Killing emulator")
 
-        killEmulatorCommand = '"%s" -s "%s" emu kill' % ( self.adbPath, "emulator-5554" )
-        subprocess.check_call(killEmulatorCommand, shell=True, env=self.androidEnvironment )
+        exitCode = self.adb.killEmulator()
+        if exitCode != 0:
+            raise error.ToolFailedError("adb emu kill", exitCode)
 
         self.logger.debug("Waiting for emulator to exit...")
 
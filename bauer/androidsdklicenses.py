@@ -0,0 +1,63 @@
+import os
+import logging
+import processrunner
+
+# The license that most of the packages installed by bauer need, with the hashes of the license
+# texts that are known to be accepted. Some packages need other licenses (e.g. the emulator
+# system images). If such a license has not been accepted, then installing the package fails
+# and the licenses are accepted at that point (see AndroidSdkPackages.ensureInstalled). sdkmanager --licenses writes the hash of every license
+# that the user accepts into a file named after the license in $ANDROID_HOME/licenses.
+REQUIRED_LICENSES = {
+    "android-sdk-license": [
+        "8933bad161af4178b1185d1a37fbf41ea5269c55",
+        "d56f5187479451eabf01fb78af6dfcb131a6481e",
+        "24333f8a63b6825ea9c5514f83c2829b004d1fee" ] }
+
+# Checks whether the license agreements of an Android SDK have been accepted, so that
+# sdkmanager --licenses (a JVM start) only needs to run when they have not.
+class AndroidSdkLicenses:
+    def __init__(self, androidHome, sdkManagerPath, toolEnv):
+        self.logger = logging.getLogger(__name__)
+        self.licensesDirectory = os.path.join(androidHome, "licenses")
+        self.sdkManagerPath = sdkManagerPath
+        self.toolEnv = toolEnv
+
+    # Accepts all license agreements with sdkmanager --licenses. Returns True if that succeeded.
+    def accept(self):
+        exitCode = processrunner.call( [self.sdkManagerPath, "--licenses"], env=self.toolEnv, input="y\n" * 100 )
+        if exitCode != 0:
+            self.logger.warning("sdkmanager --licenses failed with exit code %d", exitCode)
+            return False
+
+        self.logger.info("Done updating licenses.")
+        return True
+
+    # Returns a dict that maps the license names to the accepted hashes.
+    def getAcceptedLicenses(self):
+        acceptedLicenses = {}
+        if not os.path.isdir(self.licensesDirectory):
+            return acceptedLicenses
+
+        for licenseName in os.listdir(self.licensesDirectory):
+            try:
+                with open(os.path.join(self.licensesDirectory, licenseName), "r") as f:
+                    acceptedLicenses[licenseName] = sorted( line.strip() for line in f if line.strip() )
+            except (IOError, OSError) as e:
+                self.logger.debug("Unable to read license file %s: %s", licenseName, e)
+
+        return acceptedLicenses
+
+    def hasRequiredLicenses(self, acceptedLicenses):
+        for licenseName, hashes in REQUIRED_LICENSES.items():
+            if not set(hashes) & set(acceptedLicenses.get(licenseName, [])):
+                self.logger.debug("License %s has not been accepted", licenseName)
+                return False
+        return True
+
+    # Returns True if all required licenses have been accepted. recordedLicenses are the accepted
+    # licenses that were recorded after the last successful run of sdkmanager --licenses (see getAcceptedLicenses).
+    # If the license files have not changed since, then the licenses are accepted as well, even if
+    # sdkmanager asked for a license text that this module does not know yet.
+    def areAccepted(self, recordedLicenses = None):
+        acceptedLicenses = self.getAcceptedLicenses()
+        return self.hasRequiredLicenses(acceptedLicenses) or (bool(recordedLicenses) and recordedLicenses == acceptedLicenses)
@@ -0,0 +1,214 @@
+import os
+import re
+import sys
+import json
+import logging
+import tempfile
+import processrunner
+
+import xml.etree.ElementTree as ElementTree
+
+from bauerutilities import getCacheDirectory
+
+# Bump this whenever the layout of the cached package state changes.
+PACKAGE_CACHE_VERSION = 1
+
+# Package names that end with this suffix stand for the newest version of a package
+# (e.g. "cmake;*"). An installed version is used if there is one.
+LATEST_VERSION_SUFFIX = ";*"
+
+# sdkmanager prints e.g. "License for package Google APIs Intel x86 Atom System Image not accepted."
+# when it refuses to install a package because of its license.
+LICENSE_NOT_ACCEPTED_PATTERN = re.compile(r"[Ll]icen[cs]e.*not accepted")
+
+def printLine(line):
+    sys.stdout.write(line + "\n")
+    sys.stdout.flush()
+
+def getVersionKey(packagePath):
+    version = packagePath.rpartition(";")[2]
+    return tuple( int(part) if part.isdigit() else -1 for part in re.split(r"[.\-]", version) )
+
+# Makes sure that packages of an Android SDK are installed, without starting sdkmanager
+# (a JVM that parses the repository metadata, which takes many seconds) when they already are.
+#
+# The installed packages are read from the package.xml files that sdkmanager writes into the
+# root directory of every package. Once all requested packages were found, the package.xml files
+# of these packages are recorded in a cache keyed on ANDROID_HOME and the requested package set.
+# The next time, checking that these files are unchanged is all that has to be done.
+class AndroidSdkPackages:
+    def __init__(self, androidHome, sdkManagerPath, toolEnv):
+        self.logger = logging.getLogger(__name__)
+        self.androidHome = androidHome
+        self.sdkManagerPath = sdkManagerPath
+        self.toolEnv = toolEnv
+
+        self.installedPackages = None
+
+    # Returns a dict that maps the paths of the installed packages (e.g. "build-tools;28.0.2")
+    # to their package.xml files.
+    def getInstalledPackages(self):
+        if self.installedPackages is None:
+            self.installedPackages = self.scanInstalledPackages()
+        return self.installedPackages
+
+    def scanInstalledPackages(self):
+        packages = {}
+        for directory, subDirectories, fileNames in os.walk(self.androidHome):
+            if "package.xml" not in fileNames:
+                continue
+
+            # packages are never nested, so there is no need to look into the package contents
+            del subDirectories[:]
+
+            packageXmlPath = os.path.join(directory, "package.xml")
+            try:
+                localPackage = ElementTree.parse(packageXmlPath).getroot().find("localPackage")
+            except (ElementTree.ParseError, IOError, OSError) as e:
+                self.logger.debug("Unable to read %s: %s", packageXmlPath, e)
+                continue
+
+            if localPackage is not None and localPackage.get("path"):
+                packages[localPackage.get("path")] = packageXmlPath
+
+        return packages
+
+    # Returns the newest installed version of a package (e.g. "cmake;3.10.2.4988404" for
+    # the prefix "cmake;"), or None if no version is installed.
+    def findInstalledPackage(self, prefix):
+        versions = [ packagePath for packagePath in self.getInstalledPackages() if packagePath.startswith(prefix) ]
+        if not versions:
+            return None
+        return max(versions, key=getVersionKey)
+
+    # Asks sdkmanager for the newest available version of a package. Returns None if
+    # the package list could not be retrieved.
+    def findAvailablePackage(self, prefix):
+        try:
+            output = processrunner.checkOutput( [self.sdkManagerPath, "--list"], env=self.toolEnv )
+        except Exception:
+            self.logger.warning("Failed to get Android SDK module list")
+            return None
+
+        lastPackagePath = None
+        for line in output.splitlines():
+            line = line.strip()
+            if line.startswith(prefix):
+                lastPackagePath = line.partition(" ")[0]
+
+        return lastPackagePath
+
+    def resolvePackages(self, packages):
+        resolvedPackages = []
+        for packagePath in packages:
+            if packagePath.endswith(LATEST_VERSION_SUFFIX):
+                # "cmake;*" -> "cmake;"
+                prefix = packagePath[:-1]
+                packagePath = self.findInstalledPackage(prefix) or self.findAvailablePackage(prefix)
+            if packagePath:
+                resolvedPackages.append(packagePath)
+        return resolvedPackages
+
+    # Installs the packages that are not installed yet. Raises a ToolFailedError if sdkmanager fails.
+    # If licenses (an AndroidSdkLicenses object) is given and sdkmanager refuses to install a package
+    # because its license has not been accepted, then the licenses are accepted and the installation
+    # is tried once more.
+    def ensureInstalled(self, packages, licenses = None):
+        if self.loadCachedState(packages):
+            self.logger.info("All android packages are installed (cached).")
+            return
+
+        resolvedPackages = self.resolvePackages(packages)
+
+        missingPackages = [ packagePath for packagePath in resolvedPackages if packagePath not in self.getInstalledPackages() ]
+        if missingPackages:
+            self.logger.info("Installing android packages: %s", ", ".join(missingPackages))
+            self.installPackages(missingPackages, licenses)
+
+            self.installedPackages = None
+            missingPackages = [ packagePath for packagePath in resolvedPackages if packagePath not in self.getInstalledPackages() ]
+        else:
+            self.logger.info("All android packages are installed.")
+
+        if missingPackages:
+            self.logger.debug("Packages without package.xml after installing: %s", missingPackages)
+        else:
+            self.storeCachedState(packages, resolvedPackages)
+
+    def installPackages(self, packages, licenses):
+        command = [self.sdkManagerPath] + packages
+
+        # the output is shown as usual, but also kept to find out why sdkmanager failed
+        result = processrunner.run( command, env=self.toolEnv, captureOutput=True, stderr=processrunner.STDOUT, outputCallback=printLine )
+
+        if result.exitCode != 0 and licenses is not None and LICENSE_NOT_ACCEPTED_PATTERN.search(result.output or ""):
+            self.logger.info("Some android packages need license agreements that have not been accepted yet.")
+            if licenses.accept():
+                result = processrunner.run( command, env=self.toolEnv, stderr=processrunner.STDOUT )
+
+        processrunner.checkResult(result, None)
+
+    def getPackageCachePath(self):
+        return os.path.join(getCacheDirectory(), "androidsdkpackages.json")
+
+    def getPackageCacheKey(self, packages):
+        return json.dumps( [ os.path.realpath(self.androidHome), sorted(packages) ] )
+
+    def getPackageSignature(self, packageXmlPath):
+        stat = os.stat(packageXmlPath)
+        return [ packageXmlPath, int(stat.st_mtime), stat.st_size ]
+
+    def readPackageCache(self):
+        try:
+            with open(self.getPackageCachePath(), "rb") as f:
+                cache = json.loads( f.read().decode("utf-8") )
+        except:
+            return {}
+
+        if not isinstance(cache, dict) or cache.get("version") != PACKAGE_CACHE_VERSION:
+            return {}
+
+        return cache.get("entries", {})
+
+    # Returns True if the cache says that all packages are installed and none of their
+    # package.xml files has changed since.
+    def loadCachedState(self, packages):
+        entry = self.readPackageCache().get(self.getPackageCacheKey(packages))
+        if not entry:
+            return False
+
+        try:
+            for packagePath, signature in entry.items():
+                if self.getPackageSignature(signature[0]) != signature:
+                    self.logger.debug("Android package %s has changed", packagePath)
+                    return False
+        except (OSError, IndexError, TypeError):
+            return False
+
+        return True
+
+    def storeCachedState(self, packages, resolvedPackages):
+        try:
+            installedPackages = self.getInstalledPackages()
+
+            entries = self.readPackageCache()
+            entries[self.getPackageCacheKey(packages)] = dict( (packagePath, self.getPackageSignature(installedPackages[packagePath])) for packagePath in resolvedPackages )
+
+            cachePath = self.getPackageCachePath()
+            cacheDir = os.path.dirname(cachePath)
+            if not os.path.isdir(cacheDir):
+                os.makedirs(cacheDir)
+
+            # write to a temporary file first so that concurrent bauer runs never see a partial file
+            tempFile, tempFilePath = tempfile.mkstemp(dir=cacheDir)
+            try:
+                with os.fdopen(tempFile, "wb") as f:
+                    f.write( json.dumps( { "version": PACKAGE_CACHE_VERSION, "entries": entries } ).encode("utf-8") )
+                os.replace(tempFilePath, cachePath)
+            except:
+                os.remove(tempFilePath)
+                raise
+
+        except (OSError, IOError) as e:
+            # the cache is only an optimization. Failing to write it must not break the build.
+            self.logger.debug("Unable to store android package cache: %s", e)
@@ -1,7 +1,7 @@
 import os
 import tempfile
 import shutil
-import subprocess
+import processrunner
 
 class AndroidStudioProjectGenerator(object):
     def __init__(self, gradle, platformBuildDir, androidBuildApiVersion):
@@ -39,11 +39,10 @@ class AndroidStudioProjectGenerator(object):
 
             gradle_path = self.gradle.getGradlePath()
         
-            subprocess.check_call(
-                #'"%s" wrapper --gradle-distribution-url "https://services.gradle.org/distributions/gradle-4.10-all.zip"' % (gradle_path),
-                '"%s" wrapper --gradle-version=4.10.2' % (gradle_path),
-                shell=True,
-                cwd=gradle_temp_dir);
+            processrunner.checkCall(
+                #[gradle_path, "wrapper", "--gradle-distribution-url", "https://services.gradle.org/distributions/gradle-4.10-all.zip"],
+                [gradle_path, "wrapper", "--gradle-version=4.10.2"],
+                cwd=gradle_temp_dir)
 
             for name in os.listdir(gradle_temp_dir):
                 source_path = os.path.join( gradle_temp_dir, name)
@@ -5,6 +5,7 @@ import argparse
 import traceback
 import error
 import logging
+import profiler
 
 from bauerargparser import BauerArgParser
 from bauerargparser import HelpOptionUsed
@@ -43,6 +44,9 @@ def run(argv):
     if args == None:
         return
 
+    if getattr(args, "profile", None):
+        profiler.enable()
+
     if args.command == 'new':
         templateCreator = TemplateCreator()
         templateCreator.generate(args)
@@ -53,8 +57,15 @@ def run(argv):
 
     buildFolder = BuildFolder(bauerGlobals, generatorInfo, source_folder, args)
 
-    commandProcessor = CommandProcessor(bauerGlobals, generatorInfo, args, rootPath, source_folder, buildFolder)
-    commandProcessor.process()
+    commandProcessor = CommandProcessor(bauerGlobals, generatorInfo, args, rootPath, source_folder, buildFolder, argv)
+    try:
+        with profiler.span("process", command=args.command):
+            commandProcessor.process()
+    finally:
+        commandProcessor.close()
+
+        if profiler.isEnabled():
+            profiler.writeReport(args.profile)
 
 def main(argv):
     try:
@@ -68,14 +79,14 @@ def main(argv):
             print(" packet:", e.packet, file=sys.stderr)
             traceback.print_exc();
         else:
-            print(" ".join(str(v) for v in e.arg), file=sys.stderr)
+            print(" ".join(str(v) for v in e.args), file=sys.stderr)
         exit(1)
 
     except error.ErrorWithExitCode as e:
         if '-d' in argv:
             traceback.print_exc();
         else:
-            print(" ".join(str(v) for v in e.arg), file=sys.stderr)
+            print(" ".join(str(v) for v in e.args), file=sys.stderr)
 
         exit(e.exitCode);
 
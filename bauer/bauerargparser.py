@@ -2,6 +2,7 @@ import argparse
 import sys,os
 import error
 import logging
+import cmakelib
 
 
 class EnvDefault(argparse.Action):
@@ -89,10 +90,23 @@ class BauerArgParser():
           packageGroup.add_argument("--package-generator", action=EnvDefault, help="The CPack Generator" )
           packageGroup.add_argument("--package-folder", action=EnvDefault, help="The CPack package output folder")
 
+          cmakeGroup = parser.add_argument_group('CMake', "(optional)")
+          cmakeGroup.add_argument("--cmake-server-transport", action=EnvDefault, choices=sorted(cmakelib.communicationMethodNames.keys()), help="How to communicate with the cmake server (default: stdin)")
+          cmakeGroup.add_argument("--fast-build", action='store_true', help="Use Ninja and ccache / sccache (if available) for android make builds. This is remembered for the build folder until it is distcleaned.")
+
 
     def addBuildArguments(self, parsers):
         for parser in parsers:
           parser.add_argument('-j', '--jobs', action=EnvDefault, help="Number of concurrent jobs" );
+          parser.add_argument('--parallel-build-configs', action='store_true', help="Build the configurations of multi config build systems (e.g. Debug and Release with Xcode or Visual Studio) at the same time" );
+
+    def addParallelConfigurationArguments(self, parsers):
+        for parser in parsers:
+          parser.add_argument('--parallel-configs', action=EnvDefault, type=int, help="Number of matching configurations to process at the same time (default: 1)" );
+
+    def addProfileArguments(self, parsers):
+        for parser in parsers:
+          parser.add_argument('--profile', metavar="FILE", help="Measure how long the steps of the command take. Writes a Chrome trace-event file to FILE and a summary table to FILE.txt" );
 
     def addSimulatorArguments(self, parser):
         parser.add_argument("--run-output-file", action=EnvDefault, help="Output file to store stdout" );
@@ -103,6 +117,10 @@ class BauerArgParser():
 
     def addAndroidSimulatorArguments(self, parser):
         parser.add_argument("--run-android-fetch-output-from", action=EnvDefault, help="?" );
+        parser.add_argument("--run-android-timeout", metavar="SECONDS", action=EnvDefault, type=int, help="Abort the run if the app has not exited after this long (default: 3600)" );
+        parser.add_argument("--emulator-pool", metavar="N", action=EnvDefault, type=int, help="Keep up to N booted emulators per ABI and API level running after the run and reuse them in later runs. They are reset to a clean snapshot before every run (default: off)" );
+        parser.add_argument("--parallel-runs", metavar="N", action=EnvDefault, type=int, help="Number of android targets to run at the same time, each in its own emulator (default: 1)" );
+        parser.add_argument("--emulator-pool-idle-timeout", metavar="SECONDS", action=EnvDefault, type=int, help="Shut down pooled emulators that have not been used for this long (default: 1800)" );
 
     def addParams(self, parser):
         parser.add_argument("params", nargs="*", help="Parameters to be passed to the executable being run " );
@@ -173,6 +191,8 @@ class BauerArgParser():
         self.addBaseConfigurationArguments( [ copy ], platforms=None, require=False )
         self.addConfigurationArguments( [ prepare, build, clean, distclean, run, package, open_project ])
         self.addBuildArguments( [ build, clean, distclean, run, package ])
+        self.addParallelConfigurationArguments( [ prepare, build, clean, package ])
+        self.addProfileArguments( [ prepare, build, clean, distclean, run, package, open_project ])
 
         simGroup = run.add_argument_group("Simulator", "(optional)")
 
@@ -181,7 +201,8 @@ class BauerArgParser():
         self.addAndroidSimulatorArguments(simGroup)
 
         self.addParams(run)
-        list(map(lambda p: p.add_argument('-t', "--target", help="The target to build/run" ), [run, build]))
+        build.add_argument('-t', "--target", help="The target to build/run" )
+        run.add_argument('-t', "--target", action="append", help="The target to run. Can be given several times to run several targets (see --parallel-runs)" )
 
         copy.add_argument('-f', '--folder', help="Source folder to copy", required=True );
 
@@ -1,4 +1,6 @@
-import sys, os, subprocess
+import sys, os
+
+import processrunner
 
 class BauerGlobals:
     def __init__(self):
@@ -20,4 +22,21 @@ class BauerGlobals:
             os.startfile(filename)
         else:
             opener = "open" if sys.platform == "darwin" else "xdg-open"
-            subprocess.call([opener, filename])
+            processrunner.call([opener, filename])
+
+
+# Returns the per-user directory in which bauer keeps data that survives between invocations
+# (for example the results of expensive tool probes). Can be overridden with BAUER_CACHE_DIR.
+def getCacheDirectory():
+    cacheDir = os.environ.get("BAUER_CACHE_DIR")
+    if not cacheDir:
+        if sys.platform == "win32":
+            baseDir = os.environ.get("LOCALAPPDATA", os.path.expanduser("~/AppData/Local"))
+        elif sys.platform == "darwin":
+            baseDir = os.path.expanduser("~/Library/Caches")
+        else:
+            baseDir = os.environ.get("XDG_CACHE_HOME", os.path.expanduser("~/.cache"))
+
+        cacheDir = os.path.join(baseDir, "bauer")
+
+    return cacheDir
@@ -0,0 +1,102 @@
+from __future__ import print_function
+
+import os, sys
+import io
+import json
+import time
+import argparse
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.realpath(__file__)), ".."))
+import cmakelib
+
+# Measures how long it takes to read codemodel replies of the cmake server, with the current
+# decoder of cmakelib (FrameDecoder) and, for comparison, with the line based loop that
+# cmakelib used before:
+#
+#   python bauer/benchmark/framedecoderbenchmark.py
+#
+# (number of targets, json indentation) of the synthetic codemodel replies. Large projects
+# produce codemodel replies of several megabytes. The indented replies have many short
+# lines, which is the worst case for the line based loop.
+CODEMODEL_SIZES = [ (1000, 1), (2000, 1), (6000, None) ]
+
+FRAME_BEGIN = '[== "CMake Server" ==[\n'
+FRAME_END = ']== "CMake Server" ==]'
+
+def createCodeModelReply(targetCount):
+    targets = [ {
+        "name": "target%d" % index,
+        "type": "SHARED_LIBRARY",
+        "fullName": "libtarget%d.so" % index,
+        "artifacts": [ "/build/lib/libtarget%d.so" % index ],
+        "linkLibraries": "-lfoo -lbar " * 10,
+        "fileGroups": [ { "sources": [ "src/file%d.cpp" % fileIndex for fileIndex in range(20) ] } ] } for index in range(targetCount) ]
+
+    return {
+        "type": "reply",
+        "inReplyTo": "codemodel",
+        "cookie": "CODEMODEL",
+        "configurations": [ { "name": "", "projects": [ { "name": "boden", "targets": targets } ] } ] }
+
+class FakeServerProcess:
+    def __init__(self, data):
+        self.outPipe = io.BufferedReader(io.BytesIO(data))
+
+    def poll(self):
+        return None
+
+# The decoding loop of cmakelib.waitForRawMessage before FrameDecoder: every line is appended
+# to the received text, which is then searched for both frame markers from the start.
+def waitForRawMessageBaseline(cmakeCommand):
+    stdoutdata = ""
+    while not cmakeCommand.poll():
+        stdoutdataLine = cmakeCommand.outPipe.readline()
+        if not stdoutdataLine:
+            return None
+        stdoutdata += stdoutdataLine.decode("utf-8")
+
+        begin = stdoutdata.find(FRAME_BEGIN)
+        end = stdoutdata.find(FRAME_END)
+        if begin != -1 and end != -1:
+            return json.loads(stdoutdata[begin + len(FRAME_BEGIN):end])
+
+def measure(waitForRawMessage, frame):
+    startTime = time.time()
+    payload = waitForRawMessage(FakeServerProcess(frame))
+    duration = time.time() - startTime
+
+    if payload["cookie"] != "CODEMODEL":
+        raise Exception("Unexpected payload")
+
+    return duration
+
+# Returns a dict with one result per codemodel size. If compareBaseline is set, then the
+# results also contain the time that the line based loop took ("baselineWallTime").
+def run(compareBaseline = False):
+    cmakelib.print_communication = False
+
+    results = {}
+    for targetCount, indent in CODEMODEL_SIZES:
+        body = json.dumps(createCodeModelReply(targetCount), indent=indent)
+        frame = ("\n%s%s\n%s\n" % (FRAME_BEGIN, body, FRAME_END)).encode("utf-8")
+
+        name = "codemodel-%d%s" % (targetCount, "" if indent else "-compact")
+        results[name] = { "sizeMb": len(frame) / 1000000.0, "wallTime": measure(cmakelib.waitForRawMessage, frame) }
+
+        if compareBaseline:
+            results[name]["baselineWallTime"] = measure(waitForRawMessageBaseline, frame)
+
+    return results
+
+def main(argv):
+    parser = argparse.ArgumentParser(description="Compares the cmake server frame decoder with the line based loop that it replaced.")
+    parser.add_argument("--no-baseline", action="store_true", help="Only measure the current decoder (the line based loop takes about a minute)")
+    args = parser.parse_args(argv[1:])
+
+    print("%-24s %9s %12s %12s" % ("Reply", "Size", "Baseline", "Current"))
+    for name, result in sorted(run(not args.no_baseline).items()):
+        baseline = ("%10.3f s" % result["baselineWallTime"]) if "baselineWallTime" in result else "%12s" % "-"
+        print("%-24s %6.1f MB %s %10.3f s" % (name, result["sizeMb"], baseline, result["wallTime"]))
+
+if __name__ == "__main__":
+    main(sys.argv)
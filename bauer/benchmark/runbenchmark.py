@@ -0,0 +1,334 @@
+from __future__ import print_function
+
+import os, sys
+import json
+import time
+import shutil
+import signal
+import runpy
+import argparse
+import tempfile
+import datetime
+import subprocess
+
+# Benchmarks bauer's own orchestration: boden.py prepare / build / run are driven end to end
+# against fake cmake, gradle, sdkmanager, avdmanager, emulator and adb executables (see stubs/)
+# that replay recorded tool sessions (see sessions/). The tools answer instantly or after a fixed,
+# configured time, so the measured differences are the ones caused by bauer itself.
+#
+# For every scenario the wall time, the number of processes that bauer spawns and the peak
+# memory (RSS) of the bauer process are measured. The results are appended to a history file,
+# together with the commit they were measured on, so that the numbers can be tracked over commits:
+#
+#   python bauer/benchmark/runbenchmark.py --repeat 3
+#
+# The benchmark itself deliberately does not use bauer's process runner, so that it does not
+# depend on the code it measures.
+
+BENCHMARK_DIR = os.path.dirname(os.path.realpath(__file__))
+STUBS_DIR = os.path.join(BENCHMARK_DIR, "stubs")
+SESSIONS_DIR = os.path.join(BENCHMARK_DIR, "sessions")
+REPOSITORY_DIR = os.path.abspath(os.path.join(BENCHMARK_DIR, "..", ".."))
+BODEN_SCRIPT = os.path.join(REPOSITORY_DIR, "boden.py")
+
+sys.path.insert(0, os.path.join(BENCHMARK_DIR, ".."))
+import bauerutilities
+import framedecoderbenchmark
+
+ANDROID_ARGUMENTS = [ "-p", "android", "-b", "AndroidStudio", "-a", "x86", "-c", "Debug", "--accept-terms" ]
+
+# The scenarios build on each other and are always executed in this order. Scenarios that
+# are not selected still run (so that the selected ones find the state they expect), but are
+# not measured.
+SCENARIOS = [
+    ("prepare-cold", [ "prepare" ] + ANDROID_ARGUMENTS),
+    ("prepare-warm", [ "prepare" ] + ANDROID_ARGUMENTS),
+    ("build", [ "build" ] + ANDROID_ARGUMENTS),
+    ("run", [ "run" ] + ANDROID_ARGUMENTS + [ "-t", "testboden" ]),
+    ("run-pool-cold", [ "run" ] + ANDROID_ARGUMENTS + [ "-t", "testboden", "--emulator-pool", "1" ]),
+    ("run-pool-warm", [ "run" ] + ANDROID_ARGUMENTS + [ "-t", "testboden", "--emulator-pool", "1" ]) ]
+
+# Where the fake tools have to be placed inside ANDROID_HOME
+ANDROID_HOME_TOOLS = {
+    "tools/bin/sdkmanager": "sdkmanager",
+    "tools/bin/avdmanager": "avdmanager",
+    "platform-tools/adb": "adb",
+    "emulator/emulator": "emulator" }
+
+# How long the fake emulators get to exit after their kill file was written
+EMULATOR_EXIT_TIMEOUT_SECONDS = 5
+
+SOURCE_CMAKELISTS = "cmake_minimum_required(VERSION 3.10)\nproject(boden)\n"
+
+METRICS = [ ("wallTime", "Wall (s)", "%.2f"), ("spawns", "Spawns", "%d"), ("toolCalls", "Tool calls", "%d"), ("peakRssMb", "Peak RSS (MB)", "%.1f") ]
+
+def isProcessAlive(pid):
+    try:
+        os.kill(pid, 0)
+    except OSError:
+        return False
+    return True
+
+def median(values):
+    values = sorted(values)
+    middle = len(values) // 2
+    if len(values) % 2:
+        return values[middle]
+    return (values[middle - 1] + values[middle]) / 2.0
+
+def countLines(path):
+    if not os.path.exists(path):
+        return 0
+    with open(path, "r") as f:
+        return sum(1 for line in f if line.strip())
+
+def getPeakRssMb():
+    import resource
+    maxRss = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    # kilobytes on linux, bytes on macOS
+    if sys.platform == "darwin":
+        return maxRss / (1024.0 * 1024.0)
+    return maxRss / 1024.0
+
+# Executed in the process that is measured: runs boden.py in-process, so that the peak RSS
+# of this process is the one of bauer (and not the one of the tools it starts).
+def measureChild(resultPath, bodenArguments):
+    sys.argv = [ BODEN_SCRIPT ] + bodenArguments
+    exitCode = 0
+    try:
+        runpy.run_path(BODEN_SCRIPT, run_name="__main__")
+    except SystemExit as e:
+        exitCode = e.code if isinstance(e.code, int) else (0 if e.code is None else 1)
+
+    with open(resultPath, "w") as f:
+        json.dump({ "exitCode": exitCode, "peakRssMb": getPeakRssMb() }, f)
+
+    return exitCode
+
+class Workspace:
+    def __init__(self, keep):
+        self.keep = keep
+        self.directory = tempfile.mkdtemp(prefix="bauer-benchmark-")
+
+        self.sourceDir = os.path.join(self.directory, "source")
+        self.androidHome = os.path.join(self.directory, "android-sdk")
+        self.stateDir = os.path.join(self.directory, "state")
+        self.cacheDir = os.path.join(self.directory, "cache")
+        self.replayLogPath = os.path.join(self.directory, "replay.log")
+        self.processRecordPath = os.path.join(self.directory, "processes.jsonl")
+
+        for directory in [ self.sourceDir, self.androidHome, self.stateDir, self.cacheDir ]:
+            os.makedirs(directory)
+
+        with open(os.path.join(self.sourceDir, "CMakeLists.txt"), "w") as f:
+            f.write(SOURCE_CMAKELISTS)
+
+        for toolPath, stubName in ANDROID_HOME_TOOLS.items():
+            path = os.path.join(self.androidHome, toolPath)
+            if not os.path.isdir(os.path.dirname(path)):
+                os.makedirs(os.path.dirname(path))
+            os.symlink(os.path.join(STUBS_DIR, stubName), path)
+
+    def getEnvironment(self):
+        env = dict(os.environ)
+        env["PATH"] = STUBS_DIR + os.pathsep + env.get("PATH", "")
+        env["ANDROID_HOME"] = self.androidHome
+        env["BAUER_CACHE_DIR"] = self.cacheDir
+        env["BAUER_REPLAY_SESSIONS"] = SESSIONS_DIR
+        env["BAUER_REPLAY_STATE"] = self.stateDir
+        env["BAUER_REPLAY_LOG"] = self.replayLogPath
+        env["BAUER_PROCESS_RECORD"] = self.processRecordPath
+        for name in [ "BAUER_PROCESS_DRY_RUN", "BAUER_PROCESS_REPLAY", "ANDROID_SDK_ROOT" ]:
+            env.pop(name, None)
+        return env
+
+    # Pooled emulators outlive the runs. Stops them like 'adb emu kill' would and waits for them
+    # to exit, so that none is left running once the workspace is gone.
+    def stopEmulators(self):
+        devicesDir = os.path.join(self.stateDir, "devices")
+        if not os.path.isdir(devicesDir):
+            return
+
+        pids = []
+        for serial in os.listdir(devicesDir):
+            try:
+                with open(os.path.join(devicesDir, serial, "emulator.json"), "r") as f:
+                    pids.append(json.load(f)["pid"])
+                open(os.path.join(devicesDir, serial, "kill"), "w").close()
+            except (IOError, OSError, ValueError, KeyError):
+                # the emulator has just exited
+                pass
+
+        timeoutTime = time.time() + EMULATOR_EXIT_TIMEOUT_SECONDS
+        while any( isProcessAlive(pid) for pid in pids ) and time.time() < timeoutTime:
+            time.sleep(0.05)
+
+        for pid in pids:
+            if isProcessAlive(pid):
+                print("Killing fake emulator %d" % pid)
+                try:
+                    os.kill(pid, signal.SIGKILL)
+                except OSError:
+                    pass
+
+    def close(self):
+        self.stopEmulators()
+
+        if self.keep:
+            print("Workspace kept in %s" % self.directory)
+        else:
+            shutil.rmtree(self.directory, ignore_errors=True)
+
+class Benchmark:
+    def __init__(self, args):
+        self.args = args
+        self.selectedScenarios = args.scenarios.split(",") if args.scenarios else [ name for name, bodenArguments in SCENARIOS ]
+
+        unknown = [ name for name in self.selectedScenarios if name not in dict(SCENARIOS) ]
+        if unknown:
+            raise Exception("Unknown scenarios: %s" % ", ".join(unknown))
+
+    def runScenario(self, workspace, name, bodenArguments):
+        outputPath = os.path.join(workspace.directory, "%s.log" % name)
+        resultPath = os.path.join(workspace.directory, "%s.result.json" % name)
+
+        spawnsBefore = countLines(workspace.processRecordPath)
+        toolCallsBefore = countLines(workspace.replayLogPath)
+
+        command = [ sys.executable, os.path.realpath(__file__), "--measure-child", resultPath, "--" ] + bodenArguments
+
+        startTime = time.time()
+        with open(outputPath, "w") as outputFile:
+            exitCode = subprocess.call(command, cwd=workspace.sourceDir, env=workspace.getEnvironment(), stdout=outputFile, stderr=subprocess.STDOUT)
+        wallTime = time.time() - startTime
+
+        if exitCode != 0:
+            with open(outputPath, "r") as f:
+                sys.stdout.write(f.read())
+            raise Exception("boden.py %s failed with exit code %d (workspace: %s)" % (" ".join(bodenArguments), exitCode, workspace.directory))
+
+        with open(resultPath, "r") as f:
+            childResult = json.load(f)
+
+        return {
+            "wallTime": wallTime,
+            "spawns": countLines(workspace.processRecordPath) - spawnsBefore,
+            "toolCalls": countLines(workspace.replayLogPath) - toolCallsBefore,
+            "peakRssMb": childResult["peakRssMb"] }
+
+    def runOnce(self):
+        lastSelected = max( index for index, (name, bodenArguments) in enumerate(SCENARIOS) if name in self.selectedScenarios )
+
+        results = {}
+        workspace = Workspace(self.args.keep)
+        try:
+            for name, bodenArguments in SCENARIOS[:lastSelected + 1]:
+                result = self.runScenario(workspace, name, bodenArguments)
+                if name in self.selectedScenarios:
+                    print("  %-14s %s" % (name, "  ".join( "%s=%s" % (key, format % result[key]) for key, title, format in METRICS )))
+                    results[name] = result
+        except:
+            workspace.keep = True
+            raise
+        finally:
+            workspace.close()
+
+        return results
+
+    def run(self):
+        runs = []
+        for index in range(self.args.repeat):
+            print("Run %d/%d" % (index + 1, self.args.repeat))
+            runs.append(self.runOnce())
+
+        scenarios = {}
+        for name in self.selectedScenarios:
+            scenarios[name] = dict( (key, median([ result[name][key] for result in runs ])) for key, title, format in METRICS )
+
+        record = {
+            "commit": getCommit(),
+            "time": datetime.datetime.now().isoformat(),
+            "python": sys.version.split()[0],
+            "repeat": self.args.repeat,
+            "scenarios": scenarios }
+
+        if self.args.micro:
+            record["micro"] = framedecoderbenchmark.run()
+
+        return record
+
+def getCommit():
+    try:
+        commit = subprocess.check_output([ "git", "rev-parse", "HEAD" ], cwd=REPOSITORY_DIR).decode("utf-8").strip()
+        dirty = subprocess.check_output([ "git", "status", "--porcelain", "--untracked-files=no" ], cwd=REPOSITORY_DIR).decode("utf-8").strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+    return commit + ("-dirty" if dirty else "")
+
+def loadLastRecord(historyPath):
+    lastRecord = None
+    if os.path.exists(historyPath):
+        with open(historyPath, "r") as f:
+            for line in f:
+                if line.strip():
+                    lastRecord = json.loads(line)
+    return lastRecord
+
+def appendRecord(historyPath, record):
+    if not os.path.isdir(os.path.dirname(historyPath)):
+        os.makedirs(os.path.dirname(historyPath))
+    with open(historyPath, "a") as f:
+        f.write(json.dumps(record) + "\n")
+
+def formatValue(format, value, previousValue):
+    text = format % value
+    if previousValue:
+        text += " (%+.0f%%)" % (100.0 * (value - previousValue) / previousValue)
+    return text
+
+def printRecord(record, previousRecord):
+    if previousRecord:
+        print("\nMedian results (changes relative to %s):" % (previousRecord.get("commit") or previousRecord["time"]))
+    else:
+        print("\nMedian results:")
+
+    print("%-14s %s" % ("Scenario", " ".join( "%20s" % title for key, title, format in METRICS )))
+    scenarioNames = [ name for name, bodenArguments in SCENARIOS ]
+    for name in sorted(record["scenarios"], key=scenarioNames.index):
+        result = record["scenarios"][name]
+        previousResult = (previousRecord or {}).get("scenarios", {}).get(name, {})
+        print("%-14s %s" % (name, " ".join( "%20s" % formatValue(format, result[key], previousResult.get(key)) for key, title, format in METRICS )))
+
+    for name, result in sorted(record.get("micro", {}).items()):
+        previousResult = (previousRecord or {}).get("micro", {}).get(name, {})
+        print("%-24s %6.1f MB %s s" % (name, result["sizeMb"], formatValue("%.3f", result["wallTime"], previousResult.get("wallTime"))))
+
+def main(argv):
+    if len(argv) > 2 and argv[1] == "--measure-child":
+        return measureChild(argv[2], argv[4:])
+
+    parser = argparse.ArgumentParser(description="Benchmarks bauer against fake tools that replay recorded sessions.")
+    parser.add_argument("--repeat", type=int, default=1, help="Number of runs. The median of the runs is reported.")
+    parser.add_argument("--scenarios", help="Comma separated list of scenarios to measure (%s)" % ", ".join( name for name, bodenArguments in SCENARIOS ))
+    parser.add_argument("--micro", action="store_true", help="Also run the cmake server frame decoder micro benchmark")
+    parser.add_argument("--history", default=os.path.join(bauerutilities.getCacheDirectory(), "benchmark-history.jsonl"), help="File that the results are appended to")
+    parser.add_argument("--no-history", action="store_true", help="Do not read or write the history file")
+    parser.add_argument("--keep", action="store_true", help="Keep the temporary workspace (source, build and fake sdk directories)")
+    args = parser.parse_args(argv[1:])
+
+    record = Benchmark(args).run()
+
+    previousRecord = None
+    if not args.no_history:
+        previousRecord = loadLastRecord(args.history)
+        appendRecord(args.history, record)
+
+    printRecord(record, previousRecord)
+
+    if not args.no_history:
+        print("\nResults appended to %s" % args.history)
+
+    return 0
+
+if __name__ == "__main__":
+    sys.exit(main(sys.argv))
@@ -0,0 +1,148 @@
+# State of the emulators that the fake emulator starts. Shared by the fake adb and the fake
+# device shell commands. The boot sequence is simulated from the time since the emulator was
+# started (see sessions/adb.json): first the device is offline, then it boots, then it is booted.
+import sys, os, json, time, subprocess
+import stubcommon
+
+# Runs as the app process: it waits, then logs that it has exited (or crashed).
+APP_PROCESS_CODE = """
+import sys, os, json, time
+sys.path.insert(0, sys.argv[1])
+import fakedevice
+time.sleep(float(sys.argv[2]))
+with open(sys.argv[3], "a") as f:
+    for level, tag, message in json.loads(sys.argv[4]):
+        f.write(fakedevice.formatLogLine(os.getpid(), level, tag, message % { "pid": os.getpid() }))
+"""
+
+# Starts the app process and waits for it, like the zygote does on a device. Without it, the
+# exited app would stay a zombie (with a /proc entry) until init gets around to reaping it.
+ZYGOTE_CODE = """
+import sys, subprocess
+app = subprocess.Popen(sys.argv[1:], stdout=subprocess.DEVNULL)
+sys.stdout.write("%d\\n" % app.pid)
+sys.stdout.flush()
+app.wait()
+"""
+
+def findDevices():
+    devices = []
+    devicesDir = stubcommon.stateDirectory("devices")
+    for serial in sorted(os.listdir(devicesDir)):
+        device = FakeDevice(os.path.join(devicesDir, serial))
+        if device.isRunning():
+            devices.append(device)
+    return devices
+
+def formatLogLine(pid, level, tag, message):
+    now = time.time()
+    return "%s.%03d %5d %5d %s %s: %s\n" % (time.strftime("%m-%d %H:%M:%S", time.localtime(now)), int(now * 1000) % 1000, pid, pid, level, tag, message)
+
+class FakeDevice:
+    def __init__(self, directory):
+        self.directory = directory
+        self.serial = os.path.basename(directory)
+        self.session = stubcommon.loadSession("adb.json")
+        self.emulator = stubcommon.loadJson(os.path.join(directory, "emulator.json"), None)
+
+    def isRunning(self):
+        return self.emulator is not None and not os.path.exists(os.path.join(self.directory, "kill"))
+
+    def kill(self):
+        open(os.path.join(self.directory, "kill"), "w").close()
+
+    def getUptime(self):
+        return time.time() - self.emulator["startTime"]
+
+    def isOnline(self):
+        return self.getUptime() >= self.session["offlineSeconds"]
+
+    def isBooted(self):
+        return self.getUptime() >= self.session["offlineSeconds"] + self.session["bootSeconds"]
+
+    def getInstalledPackages(self):
+        return stubcommon.loadJson(os.path.join(self.directory, "installed.json"), [])
+
+    def installPackage(self, packageName):
+        packages = self.getInstalledPackages()
+        if packageName not in packages:
+            packages.append(packageName)
+        stubcommon.saveJson(os.path.join(self.directory, "installed.json"), packages)
+
+    def uninstallPackage(self, packageName):
+        packages = self.getInstalledPackages()
+        if packageName in packages:
+            packages.remove(packageName)
+        stubcommon.saveJson(os.path.join(self.directory, "installed.json"), packages)
+
+    # Returns a dict that maps package names to the pids of their running app processes.
+    def getRunningApps(self):
+        running = {}
+        for packageName, pid in stubcommon.loadJson(os.path.join(self.directory, "apps.json"), {}).items():
+            if isProcessAlive(pid):
+                running[packageName] = pid
+        return running
+
+    def startApp(self, packageName):
+        appSession = self.session.get("app", {})
+
+        if appSession.get("crash"):
+            exitLog = [ ("E", "AndroidRuntime", "FATAL EXCEPTION: main"), ("E", "AndroidRuntime", "Process: %s, PID: %%(pid)d" % packageName) ]
+        else:
+            exitLog = [ ("I", "ActivityManager", "Process %s (pid %%(pid)d) has died" % packageName) ]
+
+        # the app is a real host process, so that its pid is alive (and /proc/<pid> exists)
+        # exactly as long as the app runs
+        devnull = open(os.devnull, "r+")
+        zygote = subprocess.Popen(
+            [ sys.executable, "-c", ZYGOTE_CODE, sys.executable, "-c", APP_PROCESS_CODE, os.path.dirname(os.path.realpath(__file__)), str(appSession.get("runSeconds", 0)), self.getLogPath(), json.dumps(exitLog) ],
+            stdin=devnull, stdout=subprocess.PIPE, stderr=devnull, close_fds=True)
+        pid = int(zygote.stdout.readline())
+        zygote.stdout.close()
+
+        apps = stubcommon.loadJson(os.path.join(self.directory, "apps.json"), {})
+        apps[packageName] = pid
+        stubcommon.saveJson(os.path.join(self.directory, "apps.json"), apps)
+
+        self.log(pid, "I", "ActivityManager", "Start proc %d:%s/u0a80 for activity %s" % (pid, packageName, packageName))
+        return pid
+
+    def stopApp(self, packageName):
+        pid = self.getRunningApps().get(packageName)
+        if pid is not None:
+            try:
+                os.kill(pid, 9)
+            except OSError:
+                pass
+
+    # Loading a snapshot of the clean device stops the apps and forgets everything that
+    # was installed or logged since.
+    def resetToSnapshot(self):
+        for packageName in self.getRunningApps():
+            self.stopApp(packageName)
+        for fileName in ("installed.json", "apps.json", "logcat.txt"):
+            if os.path.exists(os.path.join(self.directory, fileName)):
+                os.remove(os.path.join(self.directory, fileName))
+
+    def getLogPath(self):
+        return os.path.join(self.directory, "logcat.txt")
+
+    def log(self, pid, level, tag, message):
+        with open(self.getLogPath(), "a") as f:
+            f.write(formatLogLine(pid, level, tag, message))
+
+    def getDataPath(self, devicePath):
+        return os.path.join(self.directory, "data", devicePath.lstrip("/"))
+
+def isProcessAlive(pid):
+    try:
+        os.kill(pid, 0)
+    except OSError:
+        return False
+
+    # the app processes are not waited for by anyone until init reaps them
+    try:
+        with open("/proc/%d/stat" % pid, "r") as f:
+            return f.read().split(")")[-1].split()[0] != "Z"
+    except (IOError, OSError):
+        return True
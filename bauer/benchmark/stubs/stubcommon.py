@@ -0,0 +1,47 @@
+# Helpers shared by the fake tools of the bauer benchmark harness.
+import os, json, time
+
+def sessionPath(name):
+    return os.path.join(os.environ["BAUER_REPLAY_SESSIONS"], name)
+
+def loadSession(name):
+    with open(sessionPath(name), "r") as f:
+        return json.load(f)
+
+# Every invocation is appended to the replay log, so that the harness can count process spawns.
+def recordInvocation(tool, argv):
+    logPath = os.environ.get("BAUER_REPLAY_LOG")
+    if logPath:
+        with open(logPath, "a") as f:
+            f.write(json.dumps({"tool": tool, "argv": argv[1:], "pid": os.getpid(), "time": time.time()}) + "\n")
+
+# Tool time is simulated with a configurable sleep, so that runs are comparable.
+def simulateWork(name):
+    durations = loadSession("durations.json")
+    time.sleep(durations.get(name, 0))
+
+# Directory in which the fake tools keep their state between invocations (virtual devices,
+# running emulators, installed apps).
+def stateDirectory(*parts):
+    path = os.path.join(os.environ["BAUER_REPLAY_STATE"], *parts)
+    if not os.path.isdir(path):
+        try:
+            os.makedirs(path)
+        except OSError:
+            # another fake tool (e.g. adb next to a booting emulator) created it at the same time
+            if not os.path.isdir(path):
+                raise
+    return path
+
+def loadJson(path, default):
+    try:
+        with open(path, "r") as f:
+            return json.load(f)
+    except (IOError, OSError, ValueError):
+        return default
+
+def saveJson(path, data):
+    tempPath = path + ".%d" % os.getpid()
+    with open(tempPath, "w") as f:
+        json.dump(data, f)
+    os.rename(tempPath, path)
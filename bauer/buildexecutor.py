@@ -1,18 +1,32 @@
 import logging
 import os
-import subprocess
+import processrunner
 import shutil
+import time
+import threading
 
 import error
+import profiler
 from cmake import CMake
 from compilerinfo import CompilerInfo
+from parallelconfigurations import forwardOutput
+from buildparallelism import BuildParallelism, getJobCount, getParallelismConfigureArguments
 
+try:
+    import queue
+except ImportError:
+    import Queue as queue
+
+# Forwards the output of a build that runs in the background and reports its exit code.
+def watchBuild(proc, config, outputLock, finished):
+    forwardOutput(proc.stdout, config, outputLock)
+    finished.put( (proc, proc.wait()) )
 
 class BuildExecutor:
     def __init__(self, generatorInfo, rootDirectory, sourceDirectory, buildFolder):
         self.logger = logging.getLogger(__name__)
-        self.cmake = CMake()
         self.generatorInfo = generatorInfo
+        self.cmake = CMake(generatorInfo.cmakeExecutable)
         self.sourceDirectory = sourceDirectory
         self.rootDirectory = rootDirectory
 
@@ -27,7 +41,9 @@ class BuildExecutor:
     def package(self, configuration, args):
         self.buildTarget(configuration, args, "package")
 
-    def buildTarget(self, configuration, args, target):
+    # generatorName: the generator that the build directory was configured with, if it is not
+    # the one that belongs to the build system of the configuration
+    def buildTarget(self, configuration, args, target, generatorName = None):
         configs = [configuration.config]
 
         if args.config != None:
@@ -39,13 +55,25 @@ class BuildExecutor:
         isSingleConfigBuildSystem = self.generatorInfo.isSingleConfigBuildSystem(configuration.buildsystem)
 
         if not isSingleConfigBuildSystem and args.config == None:
-            configs = []
-            for cmakeConfiguration in self.cmake.codeModel["configurations"]:
-                configs += [cmakeConfiguration["name"]]
+            configs = list(self.cmake.getCodeModelIndex().configurationNames)
+
+        buildDirectory = self.buildFolder.getBuildDir(configuration)
+
+        parallelBuild = len(configs) > 1 and getattr(args, "parallel_build_configs", False)
 
+        jobs = getJobCount(args)
+        if parallelBuild:
+            # the concurrent builds share the job budget
+            jobs = max(1, jobs // len(configs))
+
+        if generatorName is None:
+            generatorName = self.generatorInfo.getCMakeGeneratorName(configuration.buildsystem);
+        parallelism = BuildParallelism(generatorName, self.generatorInfo.cmakeVersion, jobs)
+        buildEnvironment = parallelism.getEnvironment()
+
+        commands = []
         for config in configs:
-            buildDirectory = self.buildFolder.getBuildDir(configuration)
-            commandArguments = ["\"%s\"" % self.cmake.cmakeExecutable, "--build", "\"%s\"" % buildDirectory]
+            commandArguments = [self.cmake.cmakeExecutable, "--build", buildDirectory]
 
             if target:
                 commandArguments += ["--target", target];
@@ -53,24 +81,71 @@ class BuildExecutor:
             if not isSingleConfigBuildSystem:
                 commandArguments += ["--config", config];
 
-            if args.jobs != None:
-                generatorName = self.generatorInfo.getCMakeGeneratorName(configuration.buildsystem);
-                if "Visual Studio" in generatorName:
-                    os.environ["CL"] = "/MP" + args.jobs
-                elif "Xcode" in generatorName:
-                    pass # Can' specify multicore via command line :(                
-                else:
-                    commandArguments += ["--", "-j%s" % (args.jobs) ]
+            commandArguments += parallelism.getCMakeArguments()
+
+            nativeToolArguments = parallelism.getNativeToolArguments()
+            if nativeToolArguments:
+                commandArguments += ["--"] + nativeToolArguments
+
+            commands.append( (config, commandArguments) )
+
+        if parallelBuild:
+            self.runBuildsInParallel(commands, buildDirectory, buildEnvironment)
+        else:
+            for config, commandArguments in commands:
+                self.logger.info("Calling: %s", processrunner.getCommandLine(commandArguments))
+
+                startTime = time.time()
+                with profiler.span("buildTarget", config=config, target=target):
+                    processrunner.checkCall(commandArguments, cwd=buildDirectory, env=buildEnvironment)
+
+                if len(commands) > 1:
+                    self.logger.info("Built %s in %.1fs", config, time.time() - startTime)
 
-            commandLine = " ".join(commandArguments)
-            self.logger.info("Calling: %s", commandLine)
+    # Runs the builds of several configurations of a multi config build system at the same time.
+    # As soon as one of them fails the others are stopped, including the build tools (make,
+    # xcodebuild, MSBuild, ...) that they started.
+    def runBuildsInParallel(self, commands, buildDirectory, buildEnvironment):
+        outputLock = threading.Lock()
+        finished = queue.Queue()
+        running = {}
 
-            exitCode = subprocess.call(commandLine, shell=True, cwd=buildDirectory);
-            if exitCode!=0:
-                raise error.ToolFailedError(commandLine, exitCode);
+        try:
+            for config, commandArguments in commands:
+                commandLine = processrunner.getCommandLine(commandArguments)
+                self.logger.info("Calling: %s", commandLine)
 
+                proc = processrunner.start(commandArguments, cwd=buildDirectory, env=buildEnvironment, captureOutput=True, processGroup=True)
+                running[proc] = (config, commandLine, time.time())
 
-    def prepare(self, platformState, configuration, args):
+                watchThread = threading.Thread(target=watchBuild, args=(proc, config, outputLock, finished))
+                watchThread.daemon = True
+                watchThread.start()
+
+            while running:
+                try:
+                    # with a timeout, so that Ctrl+C is not blocked on python 2
+                    proc, exitCode = finished.get(True, 0.5)
+                except queue.Empty:
+                    continue
+
+                config, commandLine, startTime = running.pop(proc)
+
+                profiler.addSpan("buildTarget", startTime, time.time() - startTime, args={ "config": config, "exitCode": exitCode })
+
+                if exitCode != 0:
+                    raise error.ToolFailedError(commandLine, exitCode);
+
+                self.logger.info("Built %s in %.1fs", config, time.time() - startTime)
+        finally:
+            for proc, (config, commandLine, startTime) in running.items():
+                if proc.poll() is None:
+                    self.logger.info("Stopping build of %s", config)
+                    processrunner.killProcessGroup(proc)
+                    proc.wait()
+
+
+    def prepare(self, platformState, configuration, args, forceConfigure = False):
         self.logger.debug("prepare(%s)", configuration)
 
         cmakeBuildDir = self.buildFolder.getBuildDir(configuration);
@@ -132,6 +207,8 @@ class BuildExecutor:
         if configuration.config:
             cmakeArguments += ["-DCMAKE_BUILD_TYPE="+configuration.config ]
 
+        cmakeArguments += getParallelismConfigureArguments(generatorName, getJobCount(args))
+
         if cmakeArch:
             cmakeArguments += ["-A "+cmakeArch ]
 
@@ -139,13 +216,10 @@ class BuildExecutor:
             shutil.rmtree(cmakeBuildDir)
 
 
-        self.cmake.open(self.sourceDirectory, cmakeBuildDir, generatorName, extraGeneratorName = "", extraEnv=cmakeEnvironment)
-
         self.logger.debug("Starting configure ...")
         self.logger.debug(" Source Directory: %s", self.sourceDirectory)
         self.logger.debug(" Output Directory: %s", cmakeBuildDir)
         self.logger.debug(" Arguments: %s", cmakeArguments)
         self.logger.debug(" Generator: %s", generatorName)
 
-
-        self.cmake.configure(cmakeArguments)
+        self.cmake.configureIfNeeded(platformState, self.sourceDirectory, cmakeBuildDir, generatorName, cmakeArguments, forceConfigure, extraEnv=cmakeEnvironment)
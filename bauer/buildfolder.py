@@ -33,13 +33,15 @@ class BuildFolder:
 
                 for arch in listDirectories(os.path.join(buildDir, platform)):
                     for buildsystem in listDirectories(os.path.join(buildDir, platform, arch)):
-                        if self.generatorInfo.isSingleConfigBuildSystem(self.generatorInfo.getBuildSystemForFolderName(buildsystem)):
+                        # Multi config build systems keep their state directly in the build system folder,
+                        # single config build systems have one sub folder per configuration. Looking at the
+                        # folder layout means that we do not have to ask cmake what kind of generator it is.
+                        if os.path.exists( os.path.join(buildDir, platform, arch, buildsystem, '.generateProjects.state') ):
+                            prepared.append( BuildConfiguration(platform=platform, arch=arch, buildsystem=buildsystem, config=None) )
+                        else:
                             for config in listDirectories( os.path.join(buildDir, platform, arch, buildsystem)):
                                 if os.path.exists( os.path.join(buildDir, platform, arch, buildsystem, config, '.generateProjects.state') ):
                                     prepared.append( BuildConfiguration(platform=platform, arch=arch, buildsystem=buildsystem, config=config) )
-                        else:
-                            if os.path.exists( os.path.join(buildDir, platform, arch, buildsystem, '.generateProjects.state') ):
-                                prepared.append( BuildConfiguration(platform=platform, arch=arch, buildsystem=buildsystem, config=None) )
         return prepared
 
     # Returns the closest match to the user selected configuration
@@ -0,0 +1,81 @@
+import os
+import multiprocessing
+
+# cmake --build --parallel was added in cmake 3.12. It passes the job count on to the
+# native build tool in the way that tool expects it (-j, -jobs, /m).
+CMAKE_PARALLEL_OPTION_VERSION = (3, 12)
+
+# Linking needs a lot more memory than compiling. With ninja we limit the number of
+# concurrent link steps to a fraction of the available cores (and never more than the job count).
+NINJA_LINK_JOBS_DIVISOR = 4
+
+def getDefaultJobCount():
+    try:
+        return multiprocessing.cpu_count()
+    except NotImplementedError:
+        return 1
+
+# Returns the number of jobs requested with -j, or the number of cores if -j was not specified.
+def getJobCount(args):
+    jobs = getattr(args, "jobs", None)
+    if jobs:
+        return max(1, int(jobs))
+    return getDefaultJobCount()
+
+# Returns the cache arguments that set up ninja job pools for the given generator and job count
+# (see getJobCount).
+def getParallelismConfigureArguments(generatorName, jobs):
+    if "Ninja" not in generatorName:
+        return []
+
+    linkJobs = max(1, min(jobs, getDefaultJobCount() // NINJA_LINK_JOBS_DIVISOR))
+    return [ "-DCMAKE_JOB_POOLS=link=%d" % linkJobs, "-DCMAKE_JOB_POOL_LINK=link" ]
+
+# Maps a job count to the mechanism that the build tool of a generator understands.
+class BuildParallelism:
+    def __init__(self, generatorName, cmakeVersion, jobs):
+        self.generatorName = generatorName
+        self.cmakeVersion = cmakeVersion
+        self.jobs = jobs
+
+    def isVisualStudio(self):
+        return "Visual Studio" in self.generatorName
+
+    def isXcode(self):
+        return "Xcode" in self.generatorName
+
+    def hasCMakeParallelOption(self):
+        return self.cmakeVersion is not None and tuple(self.cmakeVersion[:2]) >= CMAKE_PARALLEL_OPTION_VERSION
+
+    # Arguments for 'cmake --build' (before the '--' separator)
+    def getCMakeArguments(self):
+        if self.hasCMakeParallelOption():
+            return [ "--parallel", str(self.jobs) ]
+        return []
+
+    # Arguments for the native build tool (after the '--' separator). Only needed for cmake
+    # versions that do not know --parallel.
+    def getNativeToolArguments(self):
+        if self.hasCMakeParallelOption():
+            return []
+
+        if self.isVisualStudio():
+            return [ "/m:%d" % self.jobs ]
+        elif self.isXcode():
+            return [ "-jobs", str(self.jobs) ]
+        else:
+            return [ "-j%d" % self.jobs ]
+
+    # Returns the environment for the build tool process. os.environ itself is never modified.
+    def getEnvironment(self):
+        env = dict(os.environ)
+
+        if self.isVisualStudio():
+            # MSBuild only builds projects in parallel. The compiler needs /MP to
+            # compile the files of a project in parallel as well.
+            env["CL"] = (env.get("CL", "") + " /MP%d" % self.jobs).strip()
+
+        return env
+
+    def getGradleArguments(self):
+        return [ "--max-workers=%d" % self.jobs ]
@@ -9,6 +9,12 @@ import shutil
 import pprint
 import logging
 import error
+import profiler
+
+from configurefingerprint import ConfigureFingerprint
+from codemodelstore import CodeModelStore
+from codemodelindex import CodeModelIndex
+from cmakeprogress import CMakeProgress
 
 cmakelib.print_communication = False
 
@@ -26,11 +32,56 @@ class CMake:
 
         self.logger.debug("CMake found at: %s", self.cmakeExecutable)
 
+        self.communicationMethod = cmakelib.STDIN
+
+        self.proc = None
+        self.sessionKey = None
+
         self.codeModel = {}
 
+    @property
+    def codeModel(self):
+        return self._codeModel
+
+    @codeModel.setter
+    def codeModel(self, codeModel):
+        self._codeModel = codeModel
+        self._codeModelIndex = None
+
+    # The index is built when it is first needed and thrown away whenever the codemodel changes.
+    def getCodeModelIndex(self):
+        if self._codeModelIndex is None:
+            self._codeModelIndex = CodeModelIndex(self.codeModel)
+        return self._codeModelIndex
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        self.close()
+
+    def isOpen(self):
+        return self.proc is not None and self.proc.poll() is None
+
+    # Starts a cmake server for the given build directory. If a server for the same
+    # directory and generator is already running then it is reused.
     def open(self, sourceDirectory, buildDirectory, generatorName, extraGeneratorName = "", extraEnv = {}):
 
-        self.proc = cmakelib.initServerProc(self.cmakeExecutable, cmakelib.communicationMethods[0], extraEnv)
+        sessionKey = (sourceDirectory, buildDirectory, generatorName, extraGeneratorName, sorted(dict(extraEnv).items()), self.communicationMethod)
+
+        if self.isOpen() and self.sessionKey == sessionKey:
+            self.logger.debug("Reusing cmake server session for %s", buildDirectory)
+            return
+
+        self.close()
+
+        with profiler.span("cmake.open"):
+            self.startServer(sourceDirectory, buildDirectory, generatorName, extraGeneratorName, extraEnv)
+
+        self.sessionKey = sessionKey
+
+    def startServer(self, sourceDirectory, buildDirectory, generatorName, extraGeneratorName, extraEnv):
+        self.proc = cmakelib.initServerProc(self.cmakeExecutable, self.communicationMethod, extraEnv)
         if self.proc is None:
             raise Exception("Failed starting cmake server")
 
@@ -61,67 +112,112 @@ class CMake:
 
         self.globalSettings = packet
 
-    def waitForResult(self, expectedReply, expectedCookie):
-        while 1:
-            payload = cmakelib.waitForRawMessage(self.proc)
-            if payload["inReplyTo"] != expectedReply or payload["cookie"] != expectedCookie:
-                raise Exception("Invalid packet received")
+    def close(self):
+        if self.proc is None:
+            return
 
-            msgType = payload["type"]
-            if msgType == 'reply':
-                break
-            elif msgType == 'message':
-                print("--", payload["message"])
-            elif msgType == 'progress':
-                pass
-            elif msgType == 'error':
-                raise Exception("Error occured during configure:", payload["errorMessage"])
-            else:
-                raise Exception("Invalid response:", payload)
+        self.logger.debug("Shutting down cmake server")
+
+        proc = self.proc
+        self.proc = None
+        self.sessionKey = None
 
+        cmakelib.closeServerProc(proc)
+
+    def waitForResult(self, expectedReply, expectedCookie):
+        progress = CMakeProgress(expectedReply)
+        try:
+            while 1:
+                payload = cmakelib.waitForRawMessage(self.proc)
+                if payload is None:
+                    raise Exception("The cmake server closed the connection while waiting for the reply to '%s'" % expectedReply)
+
+                if payload["inReplyTo"] != expectedReply or payload["cookie"] != expectedCookie:
+                    raise Exception("Invalid packet received")
+
+                msgType = payload["type"]
+                if msgType == 'reply':
+                    return payload
+                elif msgType == 'message' or msgType == 'progress':
+                    progress.handlePacket(payload)
+                elif msgType == 'error':
+                    raise Exception("Error occured during configure:", payload["errorMessage"])
+                else:
+                    raise Exception("Invalid response:", payload)
+        finally:
+            progress.finish()
+
+
+    # Sends a request to the server and waits for its reply. Messages and progress
+    # updates that arrive in the meantime are handled by waitForResult.
+    def request(self, requestType, cookie, **fields):
+        if not self.isOpen():
+            raise Exception("No cmake server session is open")
+
+        payload = { "type": requestType, "cookie": cookie }
+        payload.update(fields)
+
+        with profiler.span("cmake." + requestType, "cmake"):
+            cmakelib.writePayload(self.proc, payload)
+            return self.waitForResult(requestType, cookie)
 
     def configure(self, extraArguments = []):
         self.logger.info("Configuring ...")
 
-        cmakelib.writePayload(self.proc, { "type":"configure", "cacheArguments": extraArguments, "cookie":"CONFIGURE" } )
-        self.waitForResult("configure", "CONFIGURE")
+        self.request("configure", "CONFIGURE", cacheArguments = extraArguments)
 
         self.logger.info("Done.")
 
         self.logger.info("Generating ...")
-        
-        cmakelib.writePayload(self.proc, { "type":"compute", "cookie":"COMPUTE" } )
-        self.waitForResult("compute", "COMPUTE")
 
-        cmakelib.writePayload(self.proc, { "type":"codemodel", "cookie":"CODEMODEL" } )
-        payload = cmakelib.waitForRawMessage(self.proc)
+        self.request("compute", "COMPUTE")
 
-        if not payload or not "cookie" in payload or payload["cookie"] != "CODEMODEL":
-            raise Exception("Something went wrong trying to configure the project. ( Unexpected response from cmake during codemodel request: %s )" % (payload))
+        self.codeModel = self.request("codemodel", "CODEMODEL")
 
-        self.codeModel = payload
+    # Configures the build directory, unless nothing has changed since the last configure
+    # run that is recorded in platformState. Returns True if cmake actually configured.
+    def configureIfNeeded(self, platformState, sourceDirectory, buildDirectory, generatorName, cacheArguments, forceConfigure = False, extraEnv = {}):
+        fingerprint = ConfigureFingerprint(self.cmakeExecutable, generatorName, cacheArguments)
 
-    def executableTarget(self, config, targetName):
-        cmakeTargetToRun = None
+        state = platformState.state
+        codeModelStore = CodeModelStore(platformState.directory)
 
-        for cmakeConfiguration in self.codeModel["configurations"]:
-            if cmakeConfiguration["name"] == '' or cmakeConfiguration["name"] == config:
-                self.logger.debug("Found config: %s", cmakeConfiguration["name"])
+        if (not forceConfigure
+                and os.path.exists(os.path.join(buildDirectory, "CMakeCache.txt"))
+                and fingerprint.matches(state.get("configure-fingerprint"))):
+            codeModel = codeModelStore.load()
+            if codeModel is not None:
+                self.logger.info("Configuration is up to date.")
+                self.codeModel = codeModel
+                return False
 
-                for cmakeProject in cmakeConfiguration["projects"]:
-                    self.logger.debug(" Found project: %s", cmakeProject["name"])
+        self.open(sourceDirectory, buildDirectory, generatorName, extraEnv=extraEnv)
+        self.configure(cacheArguments)
 
-                    for cmakeTarget in cmakeProject["targets"]:
-                        self.logger.debug("  Found target: %s", cmakeTarget["name"])
+        codeModelStore.store(self.codeModel)
+        state["configure-fingerprint"] = fingerprint.create(self.getCMakeInputs())
 
-                        if cmakeTarget["name"] == targetName:
-                            cmakeTargetToRun = cmakeTarget
+        # store right away, so that a failing build does not cause another configure next time
+        platformState.storeState()
+
+        return True
+
+    def getCache(self):
+        return self.request("cache", "CACHE")["cache"]
+
+    def getCMakeInputs(self):
+        return self.request("cmakeInputs", "CMAKEINPUTS")
+
+    def executableTarget(self, config, targetName):
+        cmakeTargetToRun = self.getCodeModelIndex().findTarget(targetName, config)
 
         if not cmakeTargetToRun:
-            raise error.ProgramArgumentError("Couldn't find module %s" % self.args.target)
+            raise error.ProgramArgumentError("Couldn't find module %s" % targetName)
+
+        self.logger.debug("Found target: %s", targetName)
 
         if cmakeTargetToRun["type"] != "EXECUTABLE":
-            raise error.ProgramArgumentError("Module %s is not an executable" % self.args.target)
+            raise error.ProgramArgumentError("Module %s is not an executable" % targetName)
 
         return cmakeTargetToRun
 
@@ -1,5 +1,7 @@
 from __future__ import print_function
-import sys, subprocess, json, os, select, shutil, time, socket
+import sys, subprocess, json, os, select, shutil, time, socket, tempfile
+
+import processrunner
 
 termwidth = 150
 
@@ -85,31 +87,82 @@ def printClient(*args):
     print()
     sys.stdout.flush()
 
+FRAME_BEGIN = b'[== "CMake Server" ==['
+FRAME_END = b']== "CMake Server" ==]'
+
+# Splits the data received from the server into frames.
+# Data is searched for frame markers only once: the decoder remembers how far
+# it has scanned and keeps incomplete data (and data that follows a complete
+# frame) in its buffer until the next call.
+class FrameDecoder(object):
+  def __init__(self):
+    self.buffer = bytearray()
+    self.scanPos = 0
+    self.payloadBegin = -1
+
+  def feed(self, data):
+    self.buffer += data
+
+  # Returns the payload of the next complete frame (as bytes) or None if more data is needed.
+  def nextFrame(self):
+    if self.payloadBegin == -1:
+      begin = self.buffer.find(FRAME_BEGIN, self.scanPos)
+      if begin == -1:
+        # anything before a possible partial begin marker is noise and can be dropped
+        keep = len(FRAME_BEGIN) - 1
+        if len(self.buffer) > keep:
+          del self.buffer[:len(self.buffer) - keep]
+        self.scanPos = 0
+        return None
+
+      self.payloadBegin = begin + len(FRAME_BEGIN)
+      self.scanPos = self.payloadBegin
+
+    end = self.buffer.find(FRAME_END, self.scanPos)
+    if end == -1:
+      # the end marker might be split across two reads, so we rescan its possible beginning next time
+      self.scanPos = max(self.payloadBegin, len(self.buffer) - len(FRAME_END) + 1)
+      return None
+
+    payload = bytes(self.buffer[self.payloadBegin:end])
+
+    del self.buffer[:end + len(FRAME_END)]
+    self.scanPos = 0
+    self.payloadBegin = -1
+
+    return payload
+
+def readAvailableData(pipe):
+  # read1 returns whatever is available (blocking only until at least one byte
+  # has arrived), which avoids splitting large frames into many small reads.
+  read1 = getattr(pipe, 'read1', None)
+  if read1 is not None:
+    return read1(65536)
+  return pipe.readline()
+
 def waitForRawMessage(cmakeCommand):
-  stdoutdata = ""
-  payload = ""
-  while not cmakeCommand.poll():
-    stdoutdataLine = cmakeCommand.outPipe.readline()
-    if stdoutdataLine:
-      if isinstance(stdoutdataLine, str):
-        stdoutdata += stdoutdataLine
-      else:
-        stdoutdata += stdoutdataLine.decode('utf-8')
-    else:
-      break
-    begin = stdoutdata.find('[== "CMake Server" ==[\n')
-    end = stdoutdata.find(']== "CMake Server" ==]')
-
-    if begin != -1 and end != -1:
-      begin += len('[== "CMake Server" ==[\n')
-      payload = stdoutdata[begin:end]
-      jsonPayload = json.loads(payload)
-      filteredPayload = filterPacket(jsonPayload)
-      if print_communication and filteredPayload:
-        printServer(filteredPayload)
-      if filteredPayload is not None or jsonPayload is None:
-          return jsonPayload
-      stdoutdata = stdoutdata[(end+len(']== "CMake Server" ==]')):]
+  decoder = getattr(cmakeCommand, 'frameDecoder', None)
+  if decoder is None:
+    decoder = FrameDecoder()
+    cmakeCommand.frameDecoder = decoder
+
+  while True:
+    payload = decoder.nextFrame()
+    if payload is None:
+      data = readAvailableData(cmakeCommand.outPipe)
+      if not data:
+        return None
+      if not isinstance(data, bytes):
+        data = data.encode('utf-8')
+      decoder.feed(data)
+      continue
+
+    jsonPayload = json.loads(payload.decode('utf-8'))
+    filteredPayload = filterPacket(jsonPayload)
+    if print_communication and filteredPayload:
+      printServer(filteredPayload)
+    if filteredPayload is not None or jsonPayload is None:
+      return jsonPayload
 
 # Python2 has no problem writing the output of encodes directly,
 # but Python3 returns only 'int's for encode and so must be turned
@@ -119,7 +172,23 @@ def waitForRawMessage(cmakeCommand):
 # this lookup cost at every byte sent isn't ideal.
 has_to_bytes = "to_bytes" in dir(10)
 
+# When set, payloads are sent one byte at a time with alternating line
+# endings, to test how cmake deals with fragmentation in the communication
+# channel. This is only useful for protocol tests - it costs one write
+# per byte.
+stress_test_fragmentation = False
+
 def writeRawData(cmakeCommand, content):
+  if stress_test_fragmentation:
+    writeRawDataFragmented(cmakeCommand, content)
+    return
+
+  if print_communication:
+    printClient(content)
+
+  cmakeCommand.write(('\n[== "CMake Server" ==[\n%s\n]== "CMake Server" ==]\n' % content).encode('utf-8'))
+
+def writeRawDataFragmented(cmakeCommand, content):
   writeRawData.counter += 1
   payload = """
 [== "CMake Server" ==[
@@ -160,16 +229,53 @@ writeRawData.counter = 0
 def writePayload(cmakeCommand, obj):
   writeRawData(cmakeCommand, json.dumps(obj))
 
+# Maps the names that can be used on the command line to the communication methods.
+communicationMethodNames = { "stdin": STDIN }
+if PIPE in communicationMethods:
+  communicationMethodNames["pipe"] = PIPE
+
 def getPipeName():
-  return "/tmp/server-test-socket"
+  # Every server gets its own socket, so that several bauer processes (and several
+  # servers inside one process) can run at the same time.
+  getPipeName.counter += 1
+  return os.path.join(tempfile.gettempdir(), "bauer-cmake-%d-%d.sock" % (os.getpid(), getPipeName.counter))
+
+getPipeName.counter = 0
+
+def connectPipe(cmakeCommand, pipeName, timeoutSeconds = 30):
+  # The server needs a moment before it listens on the socket. Instead of waiting a fixed
+  # amount of time we retry with a short, growing delay until the connection succeeds.
+  timeoutTime = time.time() + timeoutSeconds
+  delay = 0.005
+  while True:
+    sock = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+    try:
+      sock.connect(pipeName)
+      return sock
+    except socket.error:
+      sock.close()
+
+    if cmakeCommand.poll() is not None:
+      raise Exception("cmake server exited with code %d before accepting a connection" % cmakeCommand.returncode)
+
+    if time.time() >= timeoutTime:
+      raise Exception("Unable to connect to the cmake server at %s within %d seconds" % (pipeName, timeoutSeconds))
+
+    time.sleep(delay)
+    delay = min(delay * 2, 0.2)
 
 def attachPipe(cmakeCommand, pipeName):
-  time.sleep(1)
-  sock = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
-  sock.connect(pipeName)
+  sock = connectPipe(cmakeCommand, pipeName)
+
+  # The server accepts only a single connection, so the socket file is not needed anymore.
+  try:
+    os.remove(pipeName)
+  except OSError:
+    pass
+
   global serverTag
   serverTag = "SERVER(PIPE)"
-  cmakeCommand.outPipe = sock.makefile()
+  cmakeCommand.outPipe = sock.makefile('rb')
   cmakeCommand.inPipe = sock
   cmakeCommand.write = cmakeCommand.inPipe.sendall
 
@@ -184,13 +290,15 @@ def initServerProc(cmakeCommand, comm, extraEnv = {}):
 
   if comm == PIPE:
     pipeName = getPipeName()
-    cmakeCommand = subprocess.Popen([cmakeCommand, "-E", "server", "--experimental", "--pipe=" + pipeName], env=environment)
+    cmakeCommand = processrunner.start([cmakeCommand, "-E", "server", "--experimental", "--pipe=" + pipeName], env=environment)
     attachPipe(cmakeCommand, pipeName)
   else:
-    cmakeCommand = subprocess.Popen([cmakeCommand, "-E", "server", "--experimental", "--debug"],
-                                    stdin=subprocess.PIPE,
-                                    stdout=subprocess.PIPE,
-                                    env=environment)
+    # stderr is not captured, so that messages of cmake cannot get mixed into the protocol
+    cmakeCommand = processrunner.start([cmakeCommand, "-E", "server", "--experimental", "--debug"],
+                                       captureOutput=True,
+                                       stderr=None,
+                                       pipeInput=True,
+                                       env=environment)
     cmakeCommand.outPipe = cmakeCommand.stdout
     cmakeCommand.inPipe = cmakeCommand.stdin
     cmakeCommand.write = lambda val: writeAndFlush(cmakeCommand.inPipe, val)
@@ -221,6 +329,25 @@ def exitProc(cmakeCommand):
     cmakeCommand.terminate()
     raise
 
+# Shuts down a server that was started with initServerProc. Closing our end of
+# the connection tells the server to exit.
+def closeServerProc(cmakeCommand, timeoutSeconds = 5):
+  for pipe in (cmakeCommand.inPipe, cmakeCommand.outPipe):
+    try:
+      pipe.close()
+    except (IOError, OSError, socket.error):
+      pass
+
+  try:
+    cmakeCommand.wait(timeout=timeoutSeconds)
+  except subprocess.TimeoutExpired:
+    cmakeCommand.terminate()
+    try:
+      cmakeCommand.wait(timeout=timeoutSeconds)
+    except subprocess.TimeoutExpired:
+      cmakeCommand.kill()
+      cmakeCommand.wait()
+
 def waitForMessage(cmakeCommand, expected):
   data = ordered(expected)
   packet = ordered(waitForRawMessage(cmakeCommand))
@@ -272,7 +399,7 @@ def validateGlobalSettings(cmakeCommand, cmakeCommandPath, data):
   capabilities = packet['capabilities']
 
   # validate version:
-  cmakeoutput = subprocess.check_output([ cmakeCommandPath, "--version" ], universal_newlines=True)
+  cmakeoutput = processrunner.checkOutput([ cmakeCommandPath, "--version" ])
   cmakeVersion = cmakeoutput.splitlines()[0][14:]
 
   version = capabilities['version']
@@ -286,7 +413,7 @@ def validateGlobalSettings(cmakeCommand, cmakeCommandPath, data):
   # validate generators:
   generatorObjects = capabilities['generators']
 
-  cmakeoutput = subprocess.check_output([ cmakeCommandPath, "--help" ], universal_newlines=True)
+  cmakeoutput = processrunner.checkOutput([ cmakeCommandPath, "--help" ])
   index = cmakeoutput.index('\nGenerators\n\n')
   cmakeGenerators = []
   for line in cmakeoutput[index + 12:].splitlines():
@@ -0,0 +1,98 @@
+import sys
+import time
+import logging
+import profiler
+
+# Span names created from cmake messages are cut off after this many characters
+MAX_STEP_NAME_LENGTH = 80
+
+def isTerminal(stream):
+    isatty = getattr(stream, "isatty", None)
+    return bool(isatty and isatty())
+
+# Handles the message and progress packets that the cmake server sends while it works on
+# a request (see CMake.waitForResult).
+#
+# Messages are logged. The time from one message to the next is recorded as a profiler span
+# named after the first message ("Looking for pthread.h", "Detecting CXX compile features", ...),
+# so that the profile shows which step of a configure is slow. Progress packets are shown as
+# a live progress line on terminals, and every progress phase ("Configuring", "Generating")
+# is recorded as a span as well.
+class CMakeProgress:
+    def __init__(self, requestType, stream = None):
+        self.logger = logging.getLogger(__name__)
+        self.requestType = requestType
+        self.stream = stream if stream is not None else sys.stderr
+        self.liveLine = isTerminal(self.stream)
+        self.lineLength = 0
+
+        # (name, start time) of the current step and progress phase
+        self.step = None
+        self.phase = None
+
+    def handlePacket(self, payload):
+        if payload["type"] == "message":
+            self.handleMessage(payload)
+        elif payload["type"] == "progress":
+            self.handleProgress(payload)
+
+    def handleMessage(self, payload):
+        self.clearProgressLine()
+
+        message = payload.get("message", "")
+
+        # only warnings and errors have a title
+        level = logging.WARNING if payload.get("title") else logging.INFO
+        for line in message.splitlines() or [ "" ]:
+            self.logger.log(level, "-- %s", line)
+
+        self.finishStep()
+        stepName = (message.splitlines() or [ "" ])[0].strip()
+        if len(stepName) > MAX_STEP_NAME_LENGTH:
+            stepName = stepName[:MAX_STEP_NAME_LENGTH - 3] + "..."
+        self.step = (stepName, time.time())
+
+    def handleProgress(self, payload):
+        phaseName = payload.get("progressMessage", "")
+
+        if self.phase is None or self.phase[0] != phaseName:
+            self.finishPhase()
+            self.logger.debug("cmake %s: %s", self.requestType, phaseName)
+            self.phase = (phaseName, time.time())
+
+        if self.liveLine:
+            minimum = payload.get("progressMinimum", 0)
+            maximum = payload.get("progressMaximum", 0)
+            current = payload.get("progressCurrent", 0)
+
+            percent = 100 * (current - minimum) // (maximum - minimum) if maximum > minimum else 0
+            self.writeProgressLine("[%3d%%] %s" % (max(0, min(100, percent)), phaseName))
+
+    def writeProgressLine(self, text):
+        self.stream.write("\r" + text.ljust(self.lineLength))
+        self.stream.flush()
+        self.lineLength = len(text)
+
+    def clearProgressLine(self):
+        if self.lineLength:
+            self.stream.write("\r" + " " * self.lineLength + "\r")
+            self.stream.flush()
+            self.lineLength = 0
+
+    def finishStep(self):
+        if self.step is not None:
+            name, startTime = self.step
+            profiler.addSpan("cmake: " + name, startTime, time.time() - startTime, "cmake.step")
+            self.step = None
+
+    def finishPhase(self):
+        if self.phase is not None:
+            name, startTime = self.phase
+            profiler.addSpan("cmake.%s: %s" % (self.requestType, name), startTime, time.time() - startTime, "cmake.progress")
+            self.phase = None
+
+    # Called when the request has been answered (or has failed).
+    def finish(self):
+        self.clearProgressLine()
+        self.finishStep()
+        self.finishPhase()
@@ -0,0 +1,112 @@
+import os
+import shlex
+
+# Splits the linkLibraries string of a codemodel target into the individual linker arguments.
+def tokenizeLinkLibraries(linkLibraries):
+    tokens = []
+    for token in shlex.split(linkLibraries, posix=False):
+        token = token.strip('"\'')
+        # libraries can also be passed through to the linker, e.g. -Wl,--whole-archive,libfoo.a
+        if token.startswith("-Wl,"):
+            tokens += token.split(",")[1:]
+        else:
+            tokens.append(token)
+    return tokens
+
+# Returns the artifact names that a linker token can refer to.
+def getLinkTokenArtifactNames(token):
+    if token.startswith("-l") and len(token) > 2:
+        return [ "lib%s.so" % token[2:], "lib%s.a" % token[2:] ]
+    return [ os.path.basename(token) ]
+
+# Lookup tables over a cmake codemodel. The codemodel is a tree of
+# configurations -> projects -> targets. Walking it for every lookup gets
+# expensive with hundreds of targets, so the index walks it once.
+class CodeModelIndex:
+    def __init__(self, codeModel):
+        self.configurationNames = []
+        self.projects = []
+        self.targets = []
+
+        self.projectsByConfiguration = {}
+        self.targetsByConfiguration = {}
+        self.targetsByName = {}
+        self.targetsByType = {}
+        self.targetsByArtifactBasename = {}
+
+        self.configurationTargetsByName = {}
+
+        self._linkDependencies = None
+
+        for cmakeConfiguration in codeModel.get("configurations", []):
+            configurationName = cmakeConfiguration["name"]
+
+            self.configurationNames.append(configurationName)
+            configurationProjects = self.projectsByConfiguration.setdefault(configurationName, [])
+            configurationTargets = self.targetsByConfiguration.setdefault(configurationName, [])
+
+            for cmakeProject in cmakeConfiguration.get("projects", []):
+                self.projects.append(cmakeProject)
+                configurationProjects.append(cmakeProject)
+
+                for cmakeTarget in cmakeProject.get("targets", []):
+                    self.targets.append(cmakeTarget)
+                    configurationTargets.append(cmakeTarget)
+
+                    self.targetsByName.setdefault(cmakeTarget["name"], []).append(cmakeTarget)
+                    self.targetsByType.setdefault(cmakeTarget["type"], []).append(cmakeTarget)
+                    self.configurationTargetsByName[(configurationName, cmakeTarget["name"])] = cmakeTarget
+
+                    for artifact in cmakeTarget.get("artifacts", []):
+                        self.targetsByArtifactBasename.setdefault(os.path.basename(artifact), []).append(cmakeTarget)
+
+    def getProjects(self, configurationName = None):
+        if configurationName is None:
+            return self.projects
+        return self.projectsByConfiguration.get(configurationName, [])
+
+    def getTargets(self, configurationName = None):
+        if configurationName is None:
+            return self.targets
+        return self.targetsByConfiguration.get(configurationName, [])
+
+    def getTargetsOfType(self, *targetTypes):
+        result = []
+        for targetType in targetTypes:
+            result += self.targetsByType.get(targetType, [])
+        return result
+
+    def getTargetsByArtifactBasename(self, basename):
+        return self.targetsByArtifactBasename.get(basename, [])
+
+    # Returns the target with the given name in the given configuration. Single config
+    # generators report one configuration with an empty name, which matches any configuration.
+    def findTarget(self, targetName, configurationName):
+        target = self.configurationTargetsByName.get((configurationName, targetName))
+        if target is None:
+            target = self.configurationTargetsByName.get(("", targetName))
+        return target
+
+    # Returns a map from target name to the names of the library targets it links against.
+    # Every linkLibraries string is tokenized once and the tokens are looked up by artifact
+    # name, so that only complete file names match.
+    def getLinkDependencies(self):
+        if self._linkDependencies is None:
+            libraryNamesByArtifact = {}
+            for target in self.getTargetsOfType("SHARED_LIBRARY", "STATIC_LIBRARY"):
+                for artifact in target.get("artifacts", []):
+                    libraryNamesByArtifact[os.path.basename(artifact)] = target["name"]
+
+            dependencies = {}
+            for target in self.targets:
+                targetDependencies = dependencies.setdefault(target["name"], [])
+
+                for token in tokenizeLinkLibraries(target.get("linkLibraries", "")):
+                    for artifactName in getLinkTokenArtifactNames(token):
+                        dependencyName = libraryNamesByArtifact.get(artifactName)
+                        if dependencyName and dependencyName != target["name"] and dependencyName not in targetDependencies:
+                            targetDependencies.append(dependencyName)
+
+            self._linkDependencies = dependencies
+
+        return self._linkDependencies
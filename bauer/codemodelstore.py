@@ -0,0 +1,53 @@
+import os
+import json
+import tempfile
+import logging
+
+# Bump this whenever the stored layout changes, or when bauer starts to depend on
+# codemodel data that older versions did not store. Stores with a different
+# version are ignored.
+CODEMODEL_STORE_VERSION = 1
+
+# Keeps the cmake codemodel of a build directory on disk, next to the
+# .generateProjects.state file, so that commands which only need target
+# metadata do not have to start cmake.
+class CodeModelStore:
+    def __init__(self, directory):
+        self.logger = logging.getLogger(__name__)
+        self.directory = directory
+
+    def getStorePath(self):
+        return os.path.join(self.directory, ".codemodel.json")
+
+    def load(self):
+        p = self.getStorePath()
+        if not os.path.exists(p):
+            return None
+
+        try:
+            with open(p, "rb") as f:
+                stored = json.loads( f.read().decode("utf-8") )
+        except (IOError, ValueError) as e:
+            self.logger.debug("Ignoring unreadable codemodel %s: %s", p, e)
+            return None
+
+        if not isinstance(stored, dict) or stored.get("version") != CODEMODEL_STORE_VERSION:
+            self.logger.debug("Ignoring codemodel %s with a different version", p)
+            return None
+
+        return stored.get("codemodel")
+
+    def store(self, codeModel):
+        if not os.path.exists(self.directory):
+            os.makedirs(self.directory)
+
+        # Write to a temporary file first, so that an interrupted bauer never leaves
+        # a truncated codemodel behind.
+        tempFile, tempFilePath = tempfile.mkstemp(dir=self.directory)
+        try:
+            with os.fdopen(tempFile, "wb") as f:
+                f.write( json.dumps( { "version": CODEMODEL_STORE_VERSION, "codemodel": codeModel } ).encode("utf-8") )
+            os.replace(tempFilePath, self.getStorePath())
+        except:
+            os.remove(tempFilePath)
+            raise
@@ -1,6 +1,6 @@
 import logging
 import os
-import subprocess
+import processrunner
 import shutil
 
 import error
@@ -9,9 +9,9 @@ from distutils.spawn import find_executable
 from mackeychain import MacKeychain
 
 class CodeSigner:
-    def __init__(self, codeModel):
+    def __init__(self, codeModelIndex):
         self.logger = logging.getLogger(__name__)
-        self.codeModel = codeModel
+        self.codeModelIndex = codeModelIndex
         self.codeSignUtil = find_executable('codesign')
 
         if not os.path.exists(self.codeSignUtil):
@@ -26,15 +26,12 @@ class CodeSigner:
                 macKeychain.unlockKeychain(args.keychain, args.password)
 
         try:
-            for configuration in self.codeModel["configurations"]:
-                for project in configuration["projects"]:
-                    for target in project["targets"]:
-                        if target["type"] in ["SHARED_LIBRARY", "EXECUTABLE"]:
-                            for artifact in target["artifacts"]:
-                                self.logger.info("Signing: %s ...", artifact)
-                                arguments = [self.codeSignUtil, '--force', '-s', args.identity, artifact]
+            for target in self.codeModelIndex.getTargetsOfType("SHARED_LIBRARY", "EXECUTABLE"):
+                for artifact in target["artifacts"]:
+                    self.logger.info("Signing: %s ...", artifact)
+                    arguments = [self.codeSignUtil, '--force', '-s', args.identity, artifact]
 
-                                subprocess.check_call(arguments);
+                    processrunner.checkCall(arguments)
         finally:
             if args.keychain:
                 macKeychain.removeKeychain(args.keychain)
@@ -1,8 +1,11 @@
 import error
 import logging
+import cmakelib
 import os, sys
 import shutil
-import subprocess
+import copy
+import processrunner
+import profiler
 from distutils.spawn import find_executable
 
 from generatorstate import GeneratorState
@@ -13,19 +16,26 @@ from androidexecutor import AndroidExecutor
 from androidrunner import AndroidRunner
 from iosrunner import IOSRunner
 from codesigner import CodeSigner
+from parallelconfigurations import ParallelConfigurations, PARALLEL_COMMANDS
+from parallelruns import ParallelRuns
 
 
 
 class CommandProcessor:
-    def __init__(self, bauerGlobals, generatorInfo, args, rootPath, sourceFolder, buildFolder):
+    def __init__(self, bauerGlobals, generatorInfo, args, rootPath, sourceFolder, buildFolder, argv = None):
         self.args = args
+        self.argv = argv
         self.logger = logging.getLogger(__name__)
         self.bauerGlobals = bauerGlobals
         self.generatorInfo = generatorInfo
         self.buildFolder = buildFolder
         self.rootPath = rootPath
-        self.buildExecutor = BuildExecutor(generatorInfo, rootPath, sourceFolder, buildFolder)
-        self.androidExecutor = AndroidExecutor(self.buildExecutor, generatorInfo, sourceFolder, buildFolder)
+        self.sourceFolder = sourceFolder
+
+        # The executors are only created when a command actually needs them
+        # (see getBuildExecutor / getAndroidExecutor).
+        self.buildExecutor = None
+        self.androidExecutor = None
 
         self.defaultLadder = {
             ('android', None) : ('android', 'AndroidStudio'),
@@ -71,9 +81,15 @@ class CommandProcessor:
             if configuration.platform not in self.bauerGlobals.platformMap:
                 raise error.InvalidPlatformNameError(configuration.platform);
 
+        parallelConfigs = getattr(self.args, "parallel_configs", None)
+        if parallelConfigs and int(parallelConfigs) > 1 and len(selectedConfigurations) > 1 and command in PARALLEL_COMMANDS and self.argv:
+            ParallelConfigurations(self.argv, self.args, int(parallelConfigs)).process(selectedConfigurations)
+            return
+
+        for configuration in selectedConfigurations:
             buildDirectory = self.buildFolder.getBuildDir(configuration)
     
-            with GeneratorState(buildDirectory) as platformState:
+            with GeneratorState(buildDirectory) as platformState, profiler.span("configuration", configuration="/".join(filter(None, configuration))):
                 if not "build-configuration" in platformState.state or BuildConfiguration(*platformState.state["build-configuration"]) != configuration:
                     if os.path.exists(buildDirectory):
                         self.logger.info("Build system does not match the one used when the projects for this platform were first prepared. Cleaning existing build files.");
@@ -87,7 +103,9 @@ class CommandProcessor:
                 platformState.state["build-configuration"] = configuration;
         
                 if command=="prepare":
-                    self.prepare(configuration, platformState);
+                    # an explicit prepare always re-configures. This also picks up source
+                    # files that were added to globbed directories.
+                    self.prepare(configuration, platformState, forceConfigure=True);
 
                 elif command=="build":
                     self.prepare(configuration, platformState);
@@ -103,53 +121,80 @@ class CommandProcessor:
                     self.buildDeps(configuration);
 
                 elif command=="run":
-                    self.prepare(configuration, platformState);
+                    self.loadCodeModel(configuration, platformState);
                     #self.build(configuration);
                     self.run(configuration);
                 elif command=="package":
                     self.prepare(configuration, platformState);
                     self.package(configuration);
                 elif command=="codesign":
-                    self.prepare(configuration, platformState);
+                    self.loadCodeModel(configuration, platformState);
                     self.codesign(configuration)
                 elif command=="copy":
                     self.copy(buildDirectory)
                 elif command=="open":
-                    self.prepare(configuration, platformState)
+                    self.loadCodeModel(configuration, platformState)
                     self.open(configuration, buildDirectory)
                 else:
                     raise error.ProgramArgumentError("Invalid command: '%s'" % command);
 
 
-    def prepare(self, configuration, platformState):
+    # Shuts down the cmake server sessions that were started while processing the command.
+    def close(self):
+        if self.buildExecutor is not None:
+            self.buildExecutor.cmake.close()
+
+    def getBuildExecutor(self):
+        if self.buildExecutor is None:
+            self.buildExecutor = BuildExecutor(self.generatorInfo, self.rootPath, self.sourceFolder, self.buildFolder)
+
+            transport = getattr(self.args, "cmake_server_transport", None)
+            if transport:
+                self.buildExecutor.cmake.communicationMethod = cmakelib.communicationMethodNames[transport]
+
+        return self.buildExecutor
+
+    def getAndroidExecutor(self):
+        if self.androidExecutor is None:
+            self.androidExecutor = AndroidExecutor(self.getBuildExecutor(), self.generatorInfo, self.sourceFolder, self.buildFolder)
+
+        return self.androidExecutor
+
+    def getExecutor(self, configuration):
+        if configuration.platform == "android":
+            return self.getAndroidExecutor()
+        else:
+            return self.getBuildExecutor()
+
+    def prepare(self, configuration, platformState, forceConfigure = False):
         buildDirectory = self.buildFolder.getBuildDir(configuration)
         self.logger.info("Preparing %s", buildDirectory)
         
         if not os.path.isdir(buildDirectory):
             os.makedirs(buildDirectory);
 
-        if configuration.platform == "android":
-            self.androidExecutor.prepare(platformState, configuration, self.args)
-        else:
-            self.buildExecutor.prepare(platformState, configuration, self.args)
+        with profiler.span("prepare"):
+            self.getExecutor(configuration).prepare(platformState, configuration, self.args, forceConfigure)
+
+    # Commands that only need to know the targets and their artifacts go through a normal
+    # prepare. The configure check in prepare uses the current generator and arguments, and
+    # if nothing has changed it takes the codemodel that was stored by the last configure
+    # instead of starting cmake. Prepare also makes sure that the platform tools (e.g. the
+    # Android SDK packages) are there, which the later steps of these commands need.
+    def loadCodeModel(self, configuration, platformState):
+        self.prepare(configuration, platformState)
 
     def build(self, configuration):
-        if configuration.platform == "android":
-            self.androidExecutor.build(configuration, self.args)
-        else:
-            self.buildExecutor.build(configuration, self.args)
+        with profiler.span("build"):
+            self.getExecutor(configuration).build(configuration, self.args)
 
     def package(self, configuration):
-        if configuration.platform == "android":
-            self.androidExecutor.package(configuration, self.args)
-        else:
-            self.buildExecutor.package(configuration, self.args)
+        with profiler.span("package"):
+            self.getExecutor(configuration).package(configuration, self.args)
 
     def clean(self, configuration):
-        if configuration.platform == "android":
-            self.androidExecutor.clean(configuration)
-        else:
-            self.buildExecutor.clean(configuration, self.args)
+        with profiler.span("clean"):
+            self.getExecutor(configuration).clean(configuration, self.args)
 
     def distClean(self, buildDirectory):
         self.logger.info("Cleaning %s" % (buildDirectory))
@@ -157,19 +202,19 @@ class CommandProcessor:
             shutil.rmtree(buildDirectory);
 
     def codesign(self, configuration):
-        codeSigner = CodeSigner(self.buildExecutor.cmake.codeModel)
+        codeSigner = CodeSigner(self.getBuildExecutor().cmake.getCodeModelIndex())
         codeSigner.sign(self.args)
 
     def open(self, configuration, buildDirectory):
-        cmake = self.buildExecutor.cmake if not configuration.platform == "android" else self.androidExecutor.cmake
+        cmake = self.getExecutor(configuration).cmake
 
         if configuration.buildsystem == 'Xcode':
-            for cmakeConfig in cmake.codeModel['configurations']:
-                for project in cmakeConfig['projects']:
-                    project_file_name = os.path.join(buildDirectory, project['name'] + ".xcodeproj")
-                    self.logger.debug("Starting: %s", project_file_name)
-                    self.bauerGlobals.open_file(project_file_name)
-                    return
+            projects = cmake.getCodeModelIndex().getProjects()
+            if projects:
+                project_file_name = os.path.join(buildDirectory, projects[0]['name'] + ".xcodeproj")
+                self.logger.debug("Starting: %s", project_file_name)
+                self.bauerGlobals.open_file(project_file_name)
+                return
 
         elif configuration.buildsystem == 'AndroidStudio':
             self.logger.debug("Looking for 'studio'")
@@ -177,7 +222,7 @@ class CommandProcessor:
             if sys.platform == "win32":
                 defaultWindowsPath = "C:\\Program Files\\Android\\Android Studio\\bin\\studio64.exe"
                 if os.path.exists(defaultWindowsPath):
-                    subprocess.Popen([defaultWindowsPath, buildDirectory])
+                    processrunner.start([defaultWindowsPath, buildDirectory])
                     return
                 else:
                     self.logger.warning("Couldn't find Android Studio, opening project folder")
@@ -188,7 +233,7 @@ class CommandProcessor:
                 if studio_path == None:
                     self.logger.warning("Couldn't find 'studio', please install via Android Studio => Tools => Create Command-line launcher")
                 else:
-                    subprocess.Popen([studio_path, buildDirectory])
+                    processrunner.start([studio_path, buildDirectory])
                     return
 
         self.logger.debug("Trying to open %s", buildDirectory)
@@ -213,23 +258,43 @@ class CommandProcessor:
             if configuration.arch == "std" and configuration.buildsystem == 'Xcode':
                 raise error.ProgramArgumentError("Can't run on ios devices yet, specifiy architecture 'simulator' to run.")
 
-            iosRunner = IOSRunner(self.buildExecutor.cmake)
-            exitCode = iosRunner.run(configuration, self.args)
+        # -t can be given several times. Android runs can happen at the same time, because
+        # every run has its own emulator.
+        targets = self.args.target
+        parallelRuns = getattr(self.args, "parallel_runs", None)
+        if parallelRuns and int(parallelRuns) > 1 and len(targets) > 1 and configuration.platform == "android" and self.argv:
+            ParallelRuns(self.argv, self.args, int(parallelRuns), configuration).process(targets)
+            return
+
+        for target in targets:
+            self.runTarget(configuration, target)
+
+    def runTarget(self, configuration, target):
+        # the runners expect a single target
+        args = copy.copy(self.args)
+        args.target = target
+
+        if configuration.platform == "ios":
+            iosRunner = IOSRunner(self.getBuildExecutor().cmake)
+            with profiler.span("run"):
+                exitCode = iosRunner.run(configuration, args)
 
         elif configuration.platform == "android":
             if configuration.buildsystem == "AndroidStudio":
-                androidRunner = AndroidRunner(self.buildFolder, self.androidExecutor)
-                exitCode = androidRunner.run(configuration, self.args)
+                androidRunner = AndroidRunner(self.buildFolder, self.getAndroidExecutor())
+                with profiler.span("run"):
+                    exitCode = androidRunner.run(configuration, args)
             else:
                 self.logger.critical("Only AndroidStudio configurations can be run")
                 exit(1)
 
         else:
-            appRunner = DesktopRunner(self.buildExecutor.cmake, configuration, self.args)
-            exitCode = appRunner.run()
+            appRunner = DesktopRunner(self.getBuildExecutor().cmake, configuration, args)
+            with profiler.span("run"):
+                exitCode = appRunner.run()
 
         if exitCode != 0:
-            raise error.ErrorWithExitCode( "Application failed with exit code: 0x{:02x}".format(exitCode), exitCode)
+            raise error.ErrorWithExitCode(exitCode, "Application failed with exit code: 0x{:02x}".format(exitCode))
 
     def copy(self, buildDirectory):
         destFolder = os.path.join(buildDirectory, os.path.basename(self.args.folder))
@@ -0,0 +1,94 @@
+import re
+import json
+import logging
+
+import error
+import processrunner
+
+from distutils.spawn import find_executable
+
+# Supported compiler caches, in order of preference.
+COMPILER_CACHE_NAMES = [ "ccache", "sccache" ]
+
+# Finds a compiler cache on the PATH. Returns None if there is none.
+def findCompilerCache():
+    for name in COMPILER_CACHE_NAMES:
+        executable = find_executable(name)
+        if executable:
+            return CompilerCache(name, executable)
+    return None
+
+# A compiler cache (ccache or sccache) that is used as the compiler launcher of a build.
+class CompilerCache:
+    def __init__(self, name, executable):
+        self.logger = logging.getLogger(__name__)
+        self.name = name
+        self.executable = executable
+
+    def getConfigureArguments(self):
+        return [
+            "-DCMAKE_C_COMPILER_LAUNCHER=%s" % (self.executable),
+            "-DCMAKE_CXX_COMPILER_LAUNCHER=%s" % (self.executable) ]
+
+    # Returns the total number of cache hits and misses as a tuple, or None if the
+    # statistics are not available.
+    def getStatistics(self):
+        try:
+            if self.name == "sccache":
+                return self.getSccacheStatistics()
+            else:
+                return self.getCcacheStatistics()
+        except (error.ErrorWithExitCode, ValueError, KeyError, TypeError) as e:
+            self.logger.debug("Unable to read %s statistics: %s", self.name, e)
+            return None
+
+    def getCcacheStatistics(self):
+        try:
+            # machine readable output, available since ccache 3.7
+            output = processrunner.checkOutput([self.executable, "--print-stats"], stderr=processrunner.STDOUT)
+            counters = {}
+            for line in output.splitlines():
+                key, sep, value = line.partition("\t")
+                if sep and value.strip().isdigit():
+                    counters[key.strip()] = int(value)
+
+            return ( counters.get("direct_cache_hit", 0) + counters.get("preprocessed_cache_hit", 0), counters.get("cache_miss", 0) )
+
+        except error.ToolFailedError:
+            pass
+
+        output = processrunner.checkOutput([self.executable, "-s"], stderr=processrunner.STDOUT)
+
+        hits = 0
+        misses = 0
+        for line in output.splitlines():
+            match = re.match(r"\s*(cache hit \((?:direct|preprocessed)\)|cache miss)\s+(\d+)", line)
+            if match:
+                if match.group(1) == "cache miss":
+                    misses += int(match.group(2))
+                else:
+                    hits += int(match.group(2))
+
+        return (hits, misses)
+
+    def getSccacheStatistics(self):
+        output = processrunner.checkOutput([self.executable, "--show-stats", "--stats-format=json"])
+        stats = json.loads(output)["stats"]
+
+        hits = sum( stats["cache_hits"]["counts"].values() )
+        misses = sum( stats["cache_misses"]["counts"].values() )
+
+        return (hits, misses)
+
+    # Logs the hit rate between two statistics snapshots (see getStatistics).
+    def reportHitRate(self, statisticsBefore, statisticsAfter):
+        if statisticsBefore is None or statisticsAfter is None:
+            return
+
+        hits = statisticsAfter[0] - statisticsBefore[0]
+        misses = statisticsAfter[1] - statisticsBefore[1]
+
+        if hits + misses <= 0:
+            self.logger.info("%s: no cacheable compilations", self.name)
+        else:
+            self.logger.info("%s: %d hits, %d misses (%.1f%% hit rate)", self.name, hits, misses, 100.0 * hits / (hits + misses))
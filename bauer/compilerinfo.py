@@ -1,5 +1,5 @@
 import logging
-import subprocess
+import processrunner
 import os
 import sys
 
@@ -14,7 +14,7 @@ class CompilerInfo:
 
     def getGCCVersion(self):
         try:
-            out = subprocess.check_output("gcc --version", shell=True);
+            out = processrunner.checkOutput(["gcc", "--version"]);
             return self.parseVersionOutput(out, 3, preferLast=True );
         except:
             return None;
@@ -22,7 +22,7 @@ class CompilerInfo:
 
     def getClangVersion(self):
         try:
-            out = subprocess.check_output("clang --version", shell=True);
+            out = processrunner.checkOutput(["clang", "--version"]);
             return self.parseVersionOutput(out, 2, preferLast=False );
         except:
             return None;
@@ -0,0 +1,105 @@
+import os
+import hashlib
+import logging
+
+# Bump this whenever the layout of the fingerprint changes. Stored fingerprints
+# with a different version never match.
+FINGERPRINT_VERSION = 1
+
+def hashFile(path):
+    sha = hashlib.sha1()
+    with open(path, "rb") as f:
+        while True:
+            data = f.read(65536)
+            if not data:
+                break
+            sha.update(data)
+    return sha.hexdigest()
+
+def getFileSignature(path):
+    stat = os.stat(path)
+    return { "mtime": stat.st_mtime, "size": stat.st_size }
+
+# Describes everything that influences the result of a cmake configure run:
+# the cmake executable, the generator, the cache arguments and the contents of
+# all the files that cmake read while configuring (as reported by the server's
+# cmakeInputs request).
+class ConfigureFingerprint:
+    def __init__(self, cmakeExecutable, generatorName, cacheArguments):
+        self.logger = logging.getLogger(__name__)
+        self.cmakeExecutable = cmakeExecutable
+        self.generatorName = generatorName
+        self.cacheArguments = list(cacheArguments)
+
+    def getSettings(self):
+        return {
+            "version": FINGERPRINT_VERSION,
+            "cmakeExecutable": self.cmakeExecutable,
+            "cmakeExecutableSignature": getFileSignature(self.cmakeExecutable),
+            "generator": self.generatorName,
+            "cacheArguments": self.cacheArguments }
+
+    def create(self, cmakeInputs):
+        fingerprint = self.getSettings()
+
+        sourceDirectory = cmakeInputs.get("sourceDirectory", "")
+        inputFiles = {}
+
+        for buildFile in cmakeInputs.get("buildFiles", []):
+            # Temporary files are generated by cmake itself. The files that belong to cmake
+            # only change when cmake changes, which is covered by the executable signature.
+            if buildFile.get("isTemporary") or buildFile.get("isCMake"):
+                continue
+
+            for source in buildFile.get("sources", []):
+                path = source
+                if not os.path.isabs(path):
+                    path = os.path.join(sourceDirectory, path)
+
+                try:
+                    fileInfo = getFileSignature(path)
+                    fileInfo["hash"] = hashFile(path)
+                except (OSError, IOError):
+                    # a file that we cannot read cannot be checked later, so we always re-configure
+                    self.logger.debug("Unable to read cmake input file %s", path)
+                    fileInfo = { "missing": True }
+
+                inputFiles[path] = fileInfo
+
+        fingerprint["inputFiles"] = inputFiles
+
+        return fingerprint
+
+    def matches(self, storedFingerprint):
+        if not storedFingerprint or "inputFiles" not in storedFingerprint:
+            return False
+
+        try:
+            settings = self.getSettings()
+        except OSError:
+            return False
+
+        for key, value in settings.items():
+            if storedFingerprint.get(key) != value:
+                self.logger.debug("Configure setting '%s' has changed", key)
+                return False
+
+        for path, storedInfo in storedFingerprint["inputFiles"].items():
+            if storedInfo.get("missing"):
+                return False
+
+            try:
+                signature = getFileSignature(path)
+            except OSError:
+                self.logger.debug("CMake input file %s has been removed", path)
+                return False
+
+            if signature["mtime"] == storedInfo["mtime"] and signature["size"] == storedInfo["size"]:
+                continue
+
+            # The file was touched. Only its contents matter, so we compare the hash.
+            if signature["size"] != storedInfo["size"] or hashFile(path) != storedInfo["hash"]:
+                self.logger.debug("CMake input file %s has changed", path)
+                return False
+
+        return True
@@ -2,7 +2,7 @@ import logging
 import json
 import os
 import sys
-import subprocess
+import processrunner
 
 import error
 
@@ -35,7 +35,7 @@ class DesktopRunner:
         exitCode = 0
 
         try:
-            call_kwargs = { "shell": True }
+            call_kwargs = {}
 
             if self.args.run_output_file and not runOutputFileHandled:
                 stdout_file = os.open(self.args.run_output_file, os.O_WRONLY|os.O_TRUNC|os.O_CREAT)
@@ -43,11 +43,9 @@ class DesktopRunner:
 
             arguments += self.args.params
 
-            commandLine = ' '.join('"{0}"'.format(arg) for arg in arguments)
+            self.logger.debug("Executing: %s", processrunner.getCommandLine(arguments))
 
-            self.logger.debug("Executing: %s", commandLine)
-
-            exitCode = subprocess.call(commandLine, **call_kwargs);
+            exitCode = processrunner.call(arguments, **call_kwargs);
 
         finally:
             if stdout_file is not None:
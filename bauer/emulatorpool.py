@@ -0,0 +1,326 @@
+import os, sys
+import json
+import time
+import socket
+import signal
+import logging
+import tempfile
+import contextlib
+import processrunner
+
+import error
+
+from adbclient import AdbClient
+from bauerutilities import getCacheDirectory
+
+# Bump this whenever the layout of the registry changes.
+REGISTRY_VERSION = 1
+
+# Pooled emulators that have not been used for this long are shut down (see --emulator-pool-idle-timeout)
+DEFAULT_IDLE_TIMEOUT_SECONDS = 30 * 60
+
+# How long lease waits for a pooled emulator to become available when all of them are in use
+LEASE_TIMEOUT_SECONDS = 30 * 60
+
+# The state that pooled emulators are reset to before they are leased again
+CLEAN_SNAPSHOT_NAME = "bauer-clean"
+
+# Emulators use an even console port from this range, and the port after it for adb.
+FIRST_CONSOLE_PORT = 5554
+LAST_CONSOLE_PORT = 5682
+
+def isPortFree(port):
+    testSocket = socket.socket(socket.AF_INET, socket.SOCK_STREAM)
+    try:
+        testSocket.bind(("127.0.0.1", port))
+        return True
+    except socket.error:
+        return False
+    finally:
+        testSocket.close()
+
+# Returns an even console port whose adb port (the next one) is free as well. usedPorts are
+# skipped even if they are free at the moment (e.g. emulators that are still starting).
+def findFreeConsolePort(usedPorts):
+    for port in range(FIRST_CONSOLE_PORT, LAST_CONSOLE_PORT + 1, 2):
+        if port not in usedPorts and isPortFree(port) and isPortFree(port + 1):
+            return port
+    raise Exception("No free emulator port between %d and %d" % (FIRST_CONSOLE_PORT, LAST_CONSOLE_PORT + 1))
+
+def getRegistryPath():
+    return os.path.join(getCacheDirectory(), "emulatorpool.json")
+
+# Serializes the access to the registry between all bauer processes (and threads) on this machine.
+@contextlib.contextmanager
+def lockRegistry():
+    registryPath = getRegistryPath()
+    if not os.path.isdir(os.path.dirname(registryPath)):
+        os.makedirs(os.path.dirname(registryPath))
+
+    with open(registryPath + ".lock", "a+") as lockFile:
+        if sys.platform == "win32":
+            import msvcrt
+            while True:
+                try:
+                    msvcrt.locking(lockFile.fileno(), msvcrt.LK_LOCK, 1)
+                    break
+                except IOError:
+                    # LK_LOCK gives up after 10 seconds
+                    pass
+            try:
+                yield
+            finally:
+                lockFile.seek(0)
+                msvcrt.locking(lockFile.fileno(), msvcrt.LK_UNLCK, 1)
+        else:
+            import fcntl
+            fcntl.flock(lockFile.fileno(), fcntl.LOCK_EX)
+            try:
+                yield
+            finally:
+                fcntl.flock(lockFile.fileno(), fcntl.LOCK_UN)
+
+# Returns the registry: the pooled emulators and the console ports that are reserved for
+# emulators that are not pooled (a dict that maps the port to the pid of the bauer process).
+# Must only be called while the registry is locked.
+def loadRegistry():
+    registry = None
+    try:
+        with open(getRegistryPath(), "rb") as f:
+            registry = json.loads( f.read().decode("utf-8") )
+    except:
+        pass
+
+    if not isinstance(registry, dict) or registry.get("version") != REGISTRY_VERSION:
+        registry = {}
+
+    return { "emulators": registry.get("emulators", []), "reservedPorts": registry.get("reservedPorts", {}) }
+
+# Must only be called while the registry is locked.
+def storeRegistry(registry):
+    registryPath = getRegistryPath()
+    tempFile, tempFilePath = tempfile.mkstemp(dir=os.path.dirname(registryPath))
+    try:
+        with os.fdopen(tempFile, "wb") as f:
+            f.write( json.dumps( { "version": REGISTRY_VERSION, "emulators": registry["emulators"], "reservedPorts": registry["reservedPorts"] } ).encode("utf-8") )
+        os.replace(tempFilePath, registryPath)
+    except:
+        os.remove(tempFilePath)
+        raise
+
+def getUsedConsolePorts(registry):
+    return [ entry["port"] for entry in registry["emulators"] ] + [ int(port) for port in registry["reservedPorts"] ]
+
+# Reserves a console port for an emulator that is not pooled, so that concurrent bauer runs
+# never pick the same port pair. The reservation must be given back with releaseConsolePort.
+def reserveConsolePort():
+    with lockRegistry():
+        registry = loadRegistry()
+
+        # forget the reservations of bauer processes that have died
+        registry["reservedPorts"] = dict( (port, pid) for port, pid in registry["reservedPorts"].items() if processrunner.isProcessAlive(pid) )
+
+        port = findFreeConsolePort(getUsedConsolePorts(registry))
+        registry["reservedPorts"][str(port)] = os.getpid()
+        storeRegistry(registry)
+
+    return port
+
+def releaseConsolePort(port):
+    with lockRegistry():
+        registry = loadRegistry()
+        registry["reservedPorts"].pop(str(port), None)
+        storeRegistry(registry)
+
+# Keeps booted emulators alive between bauer runs, so that 'run' does not have to create and
+# cold boot a new virtual device every time (--emulator-pool).
+#
+# The pooled emulators of all bauer processes on this machine are recorded in a registry file in the
+# bauer cache directory. Access to it is serialized with a lock file. A run leases an emulator
+# that matches its ABI and API level, or starts a new one as long as the pool has fewer than poolSize
+# emulators for them. After the first boot, a snapshot of the clean device is saved. Before an
+# emulator is leased again, it is reset to that snapshot, so that every app starts on a clean device.
+#
+# There is no daemon: emulators that have been idle for longer than the idle timeout are shut down
+# by the next bauer run that uses the pool. Emulators whose process is gone are removed from the registry.
+class EmulatorPool:
+    def __init__(self, androidRunner, poolSize, idleTimeoutSeconds = None):
+        self.logger = logging.getLogger(__name__)
+        self.androidRunner = androidRunner
+        self.poolSize = max(1, poolSize)
+        self.idleTimeoutSeconds = idleTimeoutSeconds if idleTimeoutSeconds is not None else DEFAULT_IDLE_TIMEOUT_SECONDS
+
+    def getAdbClient(self, entry):
+        return AdbClient(self.androidRunner.adbPath, self.androidRunner.androidEnvironment, entry["serial"])
+
+    def isLeased(self, entry):
+        return processrunner.isProcessAlive(entry.get("leasedBy"))
+
+    # Removes the emulators that have crashed, that were left behind by a bauer process that
+    # died while starting them, or that have been idle for too long from the list and returns them.
+    # Shutting them down takes a while, so this is left to the caller (see shutDownAll), to be done
+    # after the registry has been unlocked.
+    def evict(self, emulators):
+        now = time.time()
+        remaining = []
+        evicted = []
+        for entry in emulators:
+            if entry["state"] == "starting":
+                discard = not self.isLeased(entry)
+            elif not processrunner.isProcessAlive(entry.get("emulatorPid")):
+                self.logger.debug("Pooled emulator %s is gone", entry["serial"])
+                discard = True
+            else:
+                discard = not self.isLeased(entry) and now - entry["lastUsed"] > self.idleTimeoutSeconds
+                if discard:
+                    self.logger.info("Shutting down pooled emulator %s (idle for %d seconds)", entry["serial"], now - entry["lastUsed"])
+
+            if discard:
+                evicted.append(entry)
+            else:
+                remaining.append(entry)
+
+        emulators[:] = remaining
+        return evicted
+
+    def shutDownAll(self, entries):
+        for entry in entries:
+            self.shutDown(entry)
+
+    def shutDown(self, entry):
+        emulatorPid = entry.get("emulatorPid")
+        if processrunner.isProcessAlive(emulatorPid):
+            self.getAdbClient(entry).killEmulator()
+
+            timeoutTime = time.time() + 30
+            while processrunner.isProcessAlive(emulatorPid) and time.time() < timeoutTime:
+                time.sleep(0.1)
+
+            if processrunner.isProcessAlive(emulatorPid):
+                if sys.platform == "win32":
+                    processrunner.call([ "taskkill", "/F", "/PID", str(emulatorPid) ])
+                else:
+                    try:
+                        os.kill(emulatorPid, signal.SIGKILL)
+                    except OSError:
+                        # the emulator exited in the meantime
+                        pass
+
+        processrunner.call( [self.androidRunner.avdManagerPath, "delete", "avd", "--name", entry["avd"]], env=self.androidRunner.androidEnvironment )
+
+    # Returns the registry entry of an emulator that is booted, clean and reserved for this process.
+    # It must be given back with release.
+    def lease(self, androidAbi):
+        emulatorAbi = self.androidRunner.getEmulatorAbi(androidAbi)
+        apiVersion = self.androidRunner.buildExecutor.androidEmulatorApiVersion
+
+        timeoutTime = time.time() + LEASE_TIMEOUT_SECONDS
+        waiting = False
+
+        while True:
+            with lockRegistry():
+                registry = loadRegistry()
+                emulators = registry["emulators"]
+                evicted = self.evict(emulators)
+
+                matching = [ entry for entry in emulators if entry["abi"] == emulatorAbi and entry["apiVersion"] == apiVersion ]
+                available = [ entry for entry in matching if entry["state"] == "ready" and not self.isLeased(entry) ]
+
+                entry = None
+                if available:
+                    entry = available[0]
+                elif len(matching) < self.poolSize:
+                    port = findFreeConsolePort(getUsedConsolePorts(registry))
+                    entry = {
+                        "serial": "emulator-%d" % port,
+                        "port": port,
+                        "avd": "bdnPoolAVD_%s_%s_%d" % (emulatorAbi, apiVersion, port),
+                        "abi": emulatorAbi,
+                        "apiVersion": apiVersion,
+                        "state": "starting" }
+                    emulators.append(entry)
+
+                if entry is not None:
+                    entry["leasedBy"] = os.getpid()
+                    entry["lastUsed"] = time.time()
+
+                storeRegistry(registry)
+
+            self.shutDownAll(evicted)
+
+            if entry is not None:
+                try:
+                    if entry["state"] == "starting":
+                        self.startEmulator(entry, androidAbi)
+                    else:
+                        self.resetEmulator(entry, androidAbi)
+                    return entry
+                except error.ErrorWithExitCode:
+                    self.discard(entry)
+                    raise
+                except Exception as e:
+                    # the emulator is broken. We get rid of it and try again.
+                    self.logger.warning("Pooled emulator %s is not usable (%s). Replacing it.", entry["serial"], e)
+                    self.discard(entry)
+                    continue
+
+            if time.time() >= timeoutTime:
+                raise error.ToolTimedOutError("Waiting for a pooled android emulator", LEASE_TIMEOUT_SECONDS)
+
+            if not waiting:
+                self.logger.info("All %d pooled emulators for %s / API %s are in use. Waiting...", self.poolSize, emulatorAbi, apiVersion)
+                waiting = True
+            time.sleep(1)
+
+    def startEmulator(self, entry, androidAbi):
+        self.logger.info("Starting pooled emulator %s...", entry["serial"])
+
+        self.androidRunner.createEmulatorDevice(androidAbi, entry["avd"])
+
+        # the emulator must survive this bauer process
+        emulatorCommand = self.androidRunner.getEmulatorCommand(entry["avd"], entry["port"]) + [ "-no-snapshot-save" ]
+        emulatorProcess = processrunner.start(emulatorCommand, env=self.androidRunner.androidEnvironment, detach=True)
+        entry["emulatorPid"] = emulatorProcess.pid
+        self.updateEntry(entry)
+
+        adb = self.getAdbClient(entry)
+        adb.waitForBoot(self.androidRunner.getBootTimeout(androidAbi), emulatorProcess)
+        adb.saveSnapshot(CLEAN_SNAPSHOT_NAME)
+
+        entry["state"] = "ready"
+        self.updateEntry(entry)
+
+        self.logger.info("Pooled emulator %s is ready.", entry["serial"])
+
+    def resetEmulator(self, entry, androidAbi):
+        self.logger.info("Resetting pooled emulator %s...", entry["serial"])
+
+        adb = self.getAdbClient(entry)
+        adb.loadSnapshot(CLEAN_SNAPSHOT_NAME)
+        adb.waitForBoot(self.androidRunner.getBootTimeout(androidAbi))
+
+    def updateEntry(self, entry):
+        with lockRegistry():
+            registry = loadRegistry()
+            registry["emulators"] = [ other for other in registry["emulators"] if other["serial"] != entry["serial"] ] + [ entry ]
+            storeRegistry(registry)
+
+    def discard(self, entry):
+        with lockRegistry():
+            registry = loadRegistry()
+            registry["emulators"] = [ other for other in registry["emulators"] if other["serial"] != entry["serial"] ]
+            storeRegistry(registry)
+        self.shutDown(entry)
+
+    # Gives a leased emulator back to the pool.
+    def release(self, entry):
+        with lockRegistry():
+            registry = loadRegistry()
+            for other in registry["emulators"]:
+                if other["serial"] == entry["serial"]:
+                    other["leasedBy"] = None
+                    other["lastUsed"] = time.time()
+            evicted = self.evict(registry["emulators"])
+            storeRegistry(registry)
+
+        self.shutDownAll(evicted)
@@ -40,6 +40,32 @@ class ToolFailedError(ErrorWithExitCode):
         self.toolExitCode = toolExitCode;
 
 
+class ToolNotStartedError(ToolFailedError):
+    def __init__(self, toolName, toolExitCode, reason):
+        ToolFailedError.__init__(self, toolName, toolExitCode);
+        ErrorWithExitCode.__init__(self, EXIT_TOOL_FAILED, "%s could not be started: %s" % (toolName, reason) );
+        self.reason = reason;
+
+
+class ToolTimedOutError(ErrorWithExitCode):
+    def __init__(self, toolName, timeoutSeconds):
+        ErrorWithExitCode.__init__(self, EXIT_TOOL_FAILED, "%s did not finish within %d seconds" % (toolName, timeoutSeconds) );
+        self.toolName = toolName;
+        self.timeoutSeconds = timeoutSeconds;
+
+
+class ConfigurationsFailedError(ErrorWithExitCode):
+    def __init__(self, configurationNames):
+        ErrorWithExitCode.__init__(self, EXIT_TOOL_FAILED, "Failed configurations: %s" % ", ".join(configurationNames) );
+        self.configurationNames = configurationNames;
+
+
+class RunsFailedError(ErrorWithExitCode):
+    def __init__(self, targetNames):
+        ErrorWithExitCode.__init__(self, EXIT_TOOL_FAILED, "Failed runs: %s" % ", ".join(targetNames) );
+        self.targetNames = targetNames;
+
+
 class InvalidPlatformNameError(ProgramArgumentError):
     def __init__(self, platformName):
         ProgramArgumentError.__init__(self, "Invalid platform name: '%s'" % platformName);
@@ -1,10 +1,43 @@
-import subprocess, tempfile, os
+import tempfile, os, json, re
+import processrunner
 import error
+import logging
+
+from bauerutilities import getCacheDirectory
 
 from distutils.spawn import find_executable
 
+# Bump this whenever the layout of the cached probe results changes.
+PROBE_CACHE_VERSION = 2
+
+# Aliases that do not depend on the generators supported by the installed cmake.
+STATIC_GENERATOR_ALIASES = {
+    "make": "Unix Makefiles",
+    "nmake": "NMake Makefiles",
+    "msysmake": "MSYS Makefiles",
+    "mingwmake": "MinGW Makefiles" }
+
 class GeneratorInfo(object):
+    # Finding cmake and querying its generators is expensive and many commands
+    # (help, new, distclean, ...) never need the results. So these attributes are
+    # only computed when one of them is accessed for the first time.
+    _detectedAttributes = ("cmakeExecutable", "generatorHelpList", "generatorNames", "generatorAliasMap", "generatorAliasHelp", "cmakeVersion")
+
     def __init__(self):
+        self.logger = logging.getLogger(__name__)
+        self._detected = False
+        self._cmakeError = None
+
+    def __getattr__(self, name):
+        if name in GeneratorInfo._detectedAttributes and not self.__dict__.get("_detected"):
+            self.detect()
+            return getattr(self, name)
+
+        raise AttributeError(name)
+
+    def detect(self):
+        self._detected = True
+
         self.cmakeExecutable = find_executable('cmake')
 
         if not self.cmakeExecutable or not os.path.exists(self.cmakeExecutable):
@@ -13,25 +46,26 @@ class GeneratorInfo(object):
         self.generatorHelpList = [];
         self.generatorNames = [];    
         self.generatorAliasMap = {};
+        self.cmakeVersion = None
 
-        self._cmakeError = None
+        if not self.loadCachedProbe():
+            self.probeCMake()
 
-        errOutput = ""
-        try:    
-            errOutFile, errOutFilePath = tempfile.mkstemp()            
-            try:
-                cmakeHelp = subprocess.check_output("\"" + self.cmakeExecutable + "\" --help", shell=True, universal_newlines=True, stderr=errOutFile );
-            finally:
-                os.close(errOutFile)
-                try:
-                    with open(errOutFilePath, "r") as f:
-                        errOutput = f.read().strip();
-                except:
-                    pass
-                os.remove(errOutFilePath)          
-
-        except subprocess.CalledProcessError as e:            
-            self._cmakeError = error.CMakeProblemError(e, errOutput);
+            if self._cmakeError is None:
+                self.storeCachedProbe()
+
+        self.generatorAliasHelp = "Aliases for build system names:\n";
+        for aliasName in sorted( self.generatorAliasMap.keys() ):
+            self.generatorAliasHelp += "\n%s = %s" % (aliasName, self.generatorAliasMap[aliasName]);
+
+    def probeCMake(self):
+        self.logger.debug("Querying generator list from %s", self.cmakeExecutable)
+
+        result = processrunner.run([self.cmakeExecutable, "--help"], captureOutput=True)
+        if result.exitCode != 0:
+            self._cmakeError = error.CMakeProblemError(None, result.output.strip());
+        else:
+            cmakeHelp = result.output
         
         if self._cmakeError is None:
             cmakeHelp = cmakeHelp.strip();
@@ -73,10 +107,7 @@ class GeneratorInfo(object):
                             pass;
 
 
-            self.generatorAliasMap["make"] = "Unix Makefiles"
-            self.generatorAliasMap["nmake"] = "NMake Makefiles";
-            self.generatorAliasMap["msysmake"] = "MSYS Makefiles";
-            self.generatorAliasMap["mingwmake"] = "MinGW Makefiles";
+            self.generatorAliasMap.update(STATIC_GENERATOR_ALIASES)
 
             if "CodeBlocks - Unix Makefiles" in self.generatorNames:
                 self.generatorAliasMap["codeblocks"] = "CodeBlocks - Unix Makefiles"
@@ -84,14 +115,105 @@ class GeneratorInfo(object):
 
             if "CodeLite - Unix Makefiles" in self.generatorNames:
                 self.generatorAliasMap["codelite"] = "CodeLite - Unix Makefiles"
-                
 
-        self.generatorAliasHelp = "Aliases for build system names:\n";
-        for aliasName in sorted( self.generatorAliasMap.keys() ):
-            self.generatorAliasHelp += "\n%s = %s" % (aliasName, self.generatorAliasMap[aliasName]);
+            self.cmakeVersion = self.probeCMakeVersion()
+
+    # Returns the version of cmake as a tuple of integers, or None if it cannot be determined.
+    def probeCMakeVersion(self):
+        try:
+            versionOutput = processrunner.checkOutput([self.cmakeExecutable, "--version"], stderr=processrunner.STDOUT)
+        except error.ToolFailedError as e:
+            self.logger.debug("Unable to query cmake version: %s", e)
+            return None
+
+        match = re.search(r"version (\d+)\.(\d+)(?:\.(\d+))?", versionOutput)
+        if not match:
+            return None
+
+        return tuple( int(part) for part in match.groups() if part is not None )
+
+    # The probe results only depend on the cmake executable, so we identify it by its path,
+    # modification time and size. Replacing or updating cmake invalidates the cached entry.
+    def getProbeCacheKey(self):
+        stat = os.stat(self.cmakeExecutable)
+        return os.path.realpath(self.cmakeExecutable), { "mtime": int(stat.st_mtime), "size": stat.st_size }
+
+    def getProbeCachePath(self):
+        return os.path.join(getCacheDirectory(), "generatorinfo.json")
+
+    def readProbeCache(self):
+        try:
+            with open(self.getProbeCachePath(), "rb") as f:
+                cache = json.loads( f.read().decode("utf-8") )
+        except:
+            return {}
+
+        if not isinstance(cache, dict) or cache.get("version") != PROBE_CACHE_VERSION:
+            return {}
+
+        return cache.get("entries", {})
+
+    def loadCachedProbe(self):
+        try:
+            executablePath, signature = self.getProbeCacheKey()
+        except OSError:
+            return False
+
+        entry = self.readProbeCache().get(executablePath)
+        if not entry or entry.get("signature") != signature:
+            return False
+
+        try:
+            generatorNames = list(entry["generatorNames"])
+            generatorAliasMap = dict(entry["generatorAliasMap"])
+            generatorHelpList = list(entry["generatorHelpList"])
+            cmakeVersion = tuple(entry["cmakeVersion"]) if entry["cmakeVersion"] is not None else None
+        except (KeyError, TypeError):
+            return False
+
+        self.generatorNames = generatorNames
+        self.generatorAliasMap = generatorAliasMap
+        self.generatorHelpList = generatorHelpList
+        self.cmakeVersion = cmakeVersion
+
+        self.logger.debug("Using cached generator list for %s", self.cmakeExecutable)
+        return True
+
+    def storeCachedProbe(self):
+        try:
+            executablePath, signature = self.getProbeCacheKey()
+
+            entries = self.readProbeCache()
+            entries[executablePath] = {
+                "signature": signature,
+                "generatorNames": self.generatorNames,
+                "generatorAliasMap": self.generatorAliasMap,
+                "generatorHelpList": self.generatorHelpList,
+                "cmakeVersion": self.cmakeVersion }
+
+            cachePath = self.getProbeCachePath()
+            cacheDir = os.path.dirname(cachePath)
+            if not os.path.isdir(cacheDir):
+                os.makedirs(cacheDir)
+
+            # write to a temporary file first so that concurrent bauer runs never see a partial file
+            tempFile, tempFilePath = tempfile.mkstemp(dir=cacheDir)
+            try:
+                with os.fdopen(tempFile, "wb") as f:
+                    f.write( json.dumps( { "version": PROBE_CACHE_VERSION, "entries": entries } ).encode("utf-8") )
+                os.replace(tempFilePath, cachePath)
+            except:
+                os.remove(tempFilePath)
+                raise
 
+        except (OSError, IOError) as e:
+            # the cache is only an optimization. Failing to write it must not break the build.
+            self.logger.debug("Unable to store generator list cache: %s", e)
 
     def ensureHaveCmake(self):
+        if not self._detected:
+            self.detect()
+
         if self._cmakeError is not None:
             raise self._cmakeError
 
@@ -116,4 +238,7 @@ class GeneratorInfo(object):
             return False;
 
     def getCMakeGeneratorName(self,generatorName):
+        if generatorName in STATIC_GENERATOR_ALIASES:
+            return STATIC_GENERATOR_ALIASES[generatorName]
+
         return self.generatorAliasMap.get(generatorName, generatorName)
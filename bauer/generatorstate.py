@@ -1,5 +1,6 @@
 import os
 import json
+import tempfile
 
 class GeneratorState:
     def __init__(self, directory):
@@ -31,5 +32,14 @@ class GeneratorState:
     def storeState(self):
         p = self.getStatePath();
         if os.path.exists(self.directory):
-            with open(p, "wb") as f:
-                f.write( json.dumps( self.state ).encode("utf-8") );
+            # several bauer processes can use the same build folder at the same time (e.g. run
+            # --parallel-runs). Writing to a temporary file first makes sure that they never read
+            # a partial state (which would look like a different build configuration).
+            tempFile, tempFilePath = tempfile.mkstemp(dir=self.directory)
+            try:
+                with os.fdopen(tempFile, "wb") as f:
+                    f.write( json.dumps( self.state ).encode("utf-8") );
+                os.replace(tempFilePath, p)
+            except:
+                os.remove(tempFilePath)
+                raise
@@ -1,7 +1,6 @@
-import tempfile
 import os
 import sys
-import subprocess
+import processrunner
 import logging
 import zipfile
 import shutil
@@ -15,7 +14,7 @@ class Gradle:
 
     def stop(self):
         self.logger.debug("Calling %s --stop" % (self.getGradlePath()))
-        subprocess.call('"%s" --stop' % (self.getGradlePath()), shell=True);
+        processrunner.call([self.getGradlePath(), "--stop"]);
 
 
     def getGradlePath(self):
@@ -23,15 +22,9 @@ class Gradle:
 
             # first try to call an installed gradle version.
 
-            outFile, outFilePath = tempfile.mkstemp()
-            try:
-                result = subprocess.call("gradle --version", shell=True, stdout=outFile, stderr=subprocess.STDOUT)
-            finally:
-                os.close(outFile)
-                os.remove(outFilePath)
-
-            if result==0:
-                self.gradlePath = "gradle"
+            systemGradlePath = processrunner.findExecutable("gradle")
+            if systemGradlePath and processrunner.run([systemGradlePath, "--version"], stderr=processrunner.STDOUT, captureOutput=True).exitCode == 0:
+                self.gradlePath = systemGradlePath
 
             else:
                 self.logger.debug("No system gradle found, using own...")
@@ -1,4 +1,4 @@
-import subprocess 
+import processrunner
 import re
 import logging
 
@@ -21,7 +21,7 @@ class IOSInfo:
             return self.findSimulatorOS(args.ios_simulator_os)
 
     def getAvailableDeviceTypes(self):
-        result = subprocess.check_output("xcrun simctl list", shell=True).decode(encoding='utf-8')
+        result = processrunner.checkOutput(["xcrun", "simctl", "list"])
 
         simDeviceRegex = r"(.*) \((.*SimDeviceType.*)\)"
 
@@ -36,7 +36,7 @@ class IOSInfo:
         return devices
 
     def getAvailableSimulatorOSVersions(self):
-        result = subprocess.check_output("xcrun simctl list", shell=True).decode(encoding='utf-8')
+        result = processrunner.checkOutput(["xcrun", "simctl", "list"])
 
         simRuntimeRegex = r"(.*) ([0-9]+\.[0-9]+).*(com\.apple\.CoreSimulator\.SimRuntime\..*)"
 
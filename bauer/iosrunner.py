@@ -2,7 +2,7 @@ import argparse
 import logging
 import os
 import sys
-import subprocess
+import processrunner
 import random
 import time
 import plistlib
@@ -81,7 +81,7 @@ class IOSRunner:
             self.ios_simulator_device_type, 
             self.ios_simulator_os]
 
-        simulatorId = subprocess.check_output(" ".join(arguments), shell=True).strip().decode(encoding='utf-8')
+        simulatorId = processrunner.checkOutput(arguments).strip()
 
         if not simulatorId or " " in simulatorId or "\n" in simulatorId:
             raise Exception("Invalid simulator device ID returned.")
@@ -90,17 +90,17 @@ class IOSRunner:
 
     def bootSimulator(self, simulatorId):
         self.logger.info("Booting simulator ...")
-        subprocess.check_call("open -a Simulator", shell=True)
+        processrunner.checkCall(["open", "-a", "Simulator"])
 
         # note that this will fail if the simulator is already booted or is currently booting up.
         # That is ok.
-        subprocess.call("xcrun simctl boot " + simulatorId, shell=True)
+        processrunner.call(["xcrun", "simctl", "boot", simulatorId])
 
         self.waitForSimulatorStatus(simulatorId, "booted", 600)
 
     def installApp(self, simulatorId, bundlePath):
         self.logger.info("Installing Application in simulator ...")
-        subprocess.check_output('xcrun simctl install "%s" "%s"' % (simulatorId, bundlePath), shell=True)
+        processrunner.checkOutput(["xcrun", "simctl", "install", simulatorId, bundlePath])
 
     def startApp(self, simulatorId, bundleId, args):
         self.logger.info("Starting Application ...")
@@ -114,15 +114,13 @@ class IOSRunner:
             
             self.logger.debug("Redirecting Applications stdout to: %s", abs_stdout_path)
 
-            stdoutOptions = [ '"--stdout=%s"' % abs_stdout_path ]
-            stdoutOptions += [ '"--stderr=%s.err"' % abs_stdout_path ]
+            stdoutOptions = [ "--stdout=%s" % abs_stdout_path ]
+            stdoutOptions += [ "--stderr=%s.err" % abs_stdout_path ]
 
 
         arguments = ["xcrun",  "simctl", "launch" ] + stdoutOptions + [simulatorId, bundleId] + args.params
 
-        commandLine = ' '.join('"{0}"'.format(arg) for arg in arguments)
-
-        resultLine = subprocess.check_output(commandLine, shell=True).decode(encoding='utf-8').strip()
+        resultLine = processrunner.checkOutput(arguments).strip()
 
         before, sep, processId = resultLine.rpartition(":")                    
         if not sep:
@@ -137,7 +135,7 @@ class IOSRunner:
         self.logger.info("Waiting for simulated process %s to exit ...", processId)
 
         while True:
-            processListOutput = subprocess.check_output('xcrun simctl spawn "%s" launchctl list' % simulatorId, shell=True).decode(encoding='utf-8')
+            processListOutput = processrunner.checkOutput(["xcrun", "simctl", "spawn", simulatorId, "launchctl", "list"])
 
             foundProcess = False
             for line in processListOutput.splitlines():
@@ -171,11 +169,11 @@ class IOSRunner:
 
     def shutdownSimulator(self, simulatorId):
         self.logger.info("Shutting down simulator");
-        subprocess.call('xcrun simctl shutdown "%s"' % simulatorId, shell=True );
+        processrunner.call(["xcrun", "simctl", "shutdown", simulatorId]);
         # note that shutdown automatically waits until the simulator has finished shutting down
 
         self.logger.info("Deleting simulator device.");
-        subprocess.call('xcrun simctl delete "%s"' % simulatorId, shell=True)
+        processrunner.call(["xcrun", "simctl", "delete", simulatorId])
 
     def waitForSimulatorStatus(self, simulatorId, wait_for_status, timeout_seconds):
         timeout_time = time.time()+timeout_seconds
@@ -196,7 +194,7 @@ class IOSRunner:
             time.sleep(1)
 
     def getSimulatorStatus(self, simulatorId):
-        output = subprocess.check_output("xcrun simctl list", shell=True).decode(encoding='utf-8')
+        output = processrunner.checkOutput(["xcrun", "simctl", "list"])
 
         search_for = "("+simulatorId+")"
 
@@ -1,4 +1,4 @@
-import subprocess 
+import processrunner
 import re
 import logging
 import os, sys
@@ -18,16 +18,12 @@ class MacKeychain:
 
     def callAndGet(self, cmd, useError):
         self.logger.debug('Calling %s' % cmd)
-        proc = None
+        # the error output is merged into the regular output. The commands for which we are interested
+        # in the error output do not write anything else.
         if useError:
-            proc = subprocess.Popen(cmd, stderr=subprocess.PIPE)
+            output = processrunner.run(cmd, stderr=processrunner.STDOUT, captureOutput=True).output
         else:
-            proc = subprocess.Popen(cmd, stdout=subprocess.PIPE)
-
-        if useError:
-            output = proc.stderr.read()
-        else:
-            output = proc.stdout.read()
+            output = processrunner.run(cmd, captureOutput=True).output
 
         self.logger.debug('Output:\n%s' % output)
         return output
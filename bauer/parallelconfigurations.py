@@ -0,0 +1,173 @@
+from __future__ import print_function
+
+import os, sys
+import time
+import logging
+import threading
+import processrunner
+
+import error
+import profiler
+from buildparallelism import getJobCount
+
+# Commands whose configurations do not depend on each other and can therefore be
+# processed concurrently.
+PARALLEL_COMMANDS = [ "prepare", "build", "clean", "package" ]
+
+# Commands that accept the -j option.
+COMMANDS_WITH_JOBS = [ "build", "clean", "package" ]
+
+def getConfigurationLabel(configuration):
+    return "/".join(filter(None, list(configuration)))
+
+# Copies the lines of a child process output pipe to stdout, prefixed with a label. The lock
+# is shared between all pipes that are forwarded at the same time, so that lines do not get mixed up.
+def forwardOutput(pipe, label, outputLock):
+    for line in iter(pipe.readline, b''):
+        with outputLock:
+            sys.stdout.write("[%s] %s\n" % (label, line.decode("utf-8", "replace").rstrip("\r\n")))
+            sys.stdout.flush()
+    pipe.close()
+
+# Processes several build configurations at the same time. Every configuration is handled by
+# its own bauer child process (started with the original command line plus an explicit
+# platform / arch / build system / config selection), so that the configurations do not
+# share any cmake server or process state.
+#
+# The output of the children is prefixed with the configuration and written line by line,
+# so that lines of different configurations do not get mixed up.
+class ParallelConfigurations:
+    def __init__(self, argv, args, maxParallel):
+        self.logger = logging.getLogger(__name__)
+        self.argv = argv
+        self.args = args
+        self.maxParallel = maxParallel
+        self.itemName = "configurations"
+
+        self.outputLock = threading.Lock()
+        self.queueLock = threading.Lock()
+
+        self.pending = []
+        self.results = []
+        self.processes = []
+
+    # The label that prefixes the output of the child process for an item
+    def getLabel(self, configuration):
+        return getConfigurationLabel(configuration)
+
+    # argparse uses the last occurrence of an option, so these override whatever the user specified
+    def getConfigurationArguments(self, configuration):
+        arguments = [ "--platform", configuration.platform, "--arch", configuration.arch, "--build-system", configuration.buildsystem ]
+        if configuration.config:
+            arguments += [ "--config", configuration.config ]
+        return arguments
+
+    def getChildArguments(self, configuration, jobs):
+        childArguments = [ sys.executable, os.path.abspath(self.argv[0]) ] + list(self.argv[1:])
+
+        childArguments += self.getConfigurationArguments(configuration)
+
+        childArguments += [ "--parallel-configs", "1" ]
+
+        if self.args.command in COMMANDS_WITH_JOBS:
+            childArguments += [ "--jobs", str(jobs) ]
+
+        if getattr(self.args, "profile", None):
+            childArguments += [ "--profile", self.getChildProfilePath(configuration) ]
+
+        return childArguments
+
+    # Every child writes its own trace. They are merged into the trace of this process afterwards.
+    def getChildProfilePath(self, configuration):
+        return "%s.%s.json" % (self.args.profile, "-".join(filter(None, list(configuration))))
+
+    def writeOutputLine(self, label, line):
+        with self.outputLock:
+            sys.stdout.write("[%s] %s\n" % (label, line))
+            sys.stdout.flush()
+
+    def processConfiguration(self, configuration, jobs):
+        label = self.getLabel(configuration)
+        childArguments = self.getChildArguments(configuration, jobs)
+        self.logger.debug("Starting %s", childArguments)
+
+        startTime = time.time()
+        # the child gets a process group of its own, so that the tools that it started can be
+        # stopped together with it (see process)
+        proc = processrunner.start(childArguments, captureOutput=True, processGroup=True)
+        with self.queueLock:
+            self.processes.append(proc)
+
+        forwardOutput(proc.stdout, label, self.outputLock)
+        exitCode = proc.wait()
+
+        return (configuration, exitCode, time.time() - startTime)
+
+    def worker(self, jobs):
+        while True:
+            with self.queueLock:
+                if not self.pending:
+                    return
+                configuration = self.pending.pop(0)
+
+            try:
+                result = self.processConfiguration(configuration, jobs)
+            except Exception as e:
+                self.writeOutputLine(self.getLabel(configuration), "Unable to start bauer: %s" % e)
+                result = (configuration, -1, 0.0)
+
+            with self.queueLock:
+                self.results.append(result)
+
+    def process(self, configurations):
+        self.pending = list(configurations)
+        self.results = []
+
+        workerCount = max(1, min(self.maxParallel, len(configurations)))
+
+        # The job budget is split between the configurations that run at the same time
+        jobs = max(1, getJobCount(self.args) // workerCount)
+
+        self.logger.info("Processing %d %s, %d at a time with %d jobs each", len(configurations), self.itemName, workerCount, jobs)
+
+        workers = [ threading.Thread(target=self.worker, args=(jobs,)) for i in range(workerCount) ]
+        for thread in workers:
+            thread.daemon = True
+            thread.start()
+
+        try:
+            for thread in workers:
+                # join without a timeout cannot be interrupted with Ctrl+C on python 2
+                while thread.is_alive():
+                    thread.join(0.5)
+        except KeyboardInterrupt:
+            with self.queueLock:
+                self.pending = []
+                for proc in self.processes:
+                    processrunner.killProcessGroup(proc)
+            raise
+
+        if getattr(self.args, "profile", None):
+            for configuration in configurations:
+                profiler.mergeTrace(self.getChildProfilePath(configuration))
+
+        return self.summarize(configurations)
+
+    def summarize(self, configurations):
+        resultsByConfiguration = dict( (result[0], result) for result in self.results )
+
+        failed = []
+        self.logger.info("Summary:")
+        for configuration in configurations:
+            configuration, exitCode, duration = resultsByConfiguration[configuration]
+            if exitCode == 0:
+                self.logger.info("  %s: succeeded (%.1fs)", self.getLabel(configuration), duration)
+            else:
+                self.logger.error("  %s: failed with exit code %d (%.1fs)", self.getLabel(configuration), exitCode, duration)
+                failed.append(configuration)
+
+        if failed:
+            raise self.getFailedError([ self.getLabel(configuration) for configuration in failed ])
+
+    def getFailedError(self, labels):
+        return error.ConfigurationsFailedError(labels)
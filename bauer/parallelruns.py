@@ -0,0 +1,66 @@
+import os, sys
+import logging
+
+import error
+from parallelconfigurations import ParallelConfigurations
+
+# The options that select the target to run
+TARGET_OPTIONS = [ "-t", "--target" ]
+
+# Returns the arguments without the target selection.
+def removeTargetArguments(arguments):
+    result = []
+    index = 0
+    while index < len(arguments):
+        argument = arguments[index]
+        index += 1
+
+        if argument in TARGET_OPTIONS:
+            # skip the value as well
+            index += 1
+        elif argument.startswith("--target=") or (argument.startswith("-t") and not argument.startswith("--")):
+            pass
+        else:
+            result.append(argument)
+
+    return result
+
+# Runs several targets of one configuration at the same time (run --parallel-runs). Like
+# ParallelConfigurations, every target is run by its own bauer child process, with the
+# original command line plus a single --target. On android, every child starts its own
+# emulator on its own port pair (or leases one from the emulator pool).
+class ParallelRuns(ParallelConfigurations):
+    def __init__(self, argv, args, maxParallel, configuration):
+        ParallelConfigurations.__init__(self, argv, args, maxParallel)
+        self.logger = logging.getLogger(__name__)
+        self.configuration = configuration
+        self.itemName = "runs"
+
+    def getLabel(self, target):
+        return target
+
+    def getChildArguments(self, target, jobs):
+        arguments = list(self.argv[1:])
+
+        # everything after "--" is passed on to the app
+        appArguments = []
+        if "--" in arguments:
+            appArguments = arguments[arguments.index("--"):]
+            arguments = arguments[:arguments.index("--")]
+
+        childArguments = [ sys.executable, os.path.abspath(self.argv[0]) ] + removeTargetArguments(arguments)
+
+        childArguments += self.getConfigurationArguments(self.configuration)
+
+        childArguments += [ "--target", target, "--parallel-runs", "1" ]
+
+        if getattr(self.args, "profile", None):
+            childArguments += [ "--profile", self.getChildProfilePath(target) ]
+
+        return childArguments + appArguments
+
+    def getChildProfilePath(self, target):
+        return "%s.%s.json" % (self.args.profile, target)
+
+    def getFailedError(self, labels):
+        return error.RunsFailedError(labels)
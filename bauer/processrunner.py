@@ -0,0 +1,351 @@
+import os, sys
+import io
+import errno
+import json
+import time
+import logging
+import threading
+import subprocess
+
+import error
+import profiler
+
+from distutils.spawn import find_executable
+
+# Redirects stderr into the captured output (see ProcessRunner.run)
+STDOUT = subprocess.STDOUT
+
+# Exit code that is reported when the executable could not be started (the same that a shell returns)
+EXIT_COMMAND_NOT_FOUND = 127
+
+# Like find_executable, but also finds batch files on windows (e.g. gradle.bat).
+def findExecutable(name):
+    if sys.platform == "win32":
+        for extension in [ ".exe", ".bat", ".cmd" ]:
+            path = find_executable(name + extension)
+            if path:
+                return path
+        return None
+
+    return find_executable(name)
+
+# Returns the Popen arguments that start a process that is not tied to our console or process
+# group, so that it keeps running after bauer exits (and is not hit by a Ctrl+C meant for bauer).
+def getDetachedProcessArguments():
+    if sys.platform == "win32":
+        DETACHED_PROCESS = 0x00000008
+        return { "creationflags": DETACHED_PROCESS | subprocess.CREATE_NEW_PROCESS_GROUP }
+    return { "preexec_fn": os.setsid }
+
+# Returns the Popen arguments that start a process in a process group of its own, so that the
+# process and everything it starts can be stopped together (see killProcessGroup).
+def getProcessGroupArguments():
+    if sys.platform == "win32":
+        return { "creationflags": subprocess.CREATE_NEW_PROCESS_GROUP }
+    return { "preexec_fn": os.setsid }
+
+# Stops a process that was started with processGroup=True together with all processes that it started.
+def killProcessGroup(proc):
+    if proc.poll() is not None or not proc.pid:
+        return
+
+    if sys.platform == "win32":
+        # taskkill /T stops the whole process tree
+        with open(os.devnull, "r+b") as devnull:
+            subprocess.call([ "taskkill", "/F", "/T", "/PID", str(proc.pid) ], stdout=devnull, stderr=devnull)
+    else:
+        import signal
+        try:
+            os.killpg(proc.pid, signal.SIGTERM)
+        except OSError:
+            # the group is already gone
+            pass
+
+# Returns True if a process with the given pid is running. Works for processes that
+# are not our children, too.
+def isProcessAlive(pid):
+    if not pid:
+        return False
+
+    if sys.platform == "win32":
+        import ctypes
+        PROCESS_QUERY_LIMITED_INFORMATION = 0x1000
+        STILL_ACTIVE = 259
+        handle = ctypes.windll.kernel32.OpenProcess(PROCESS_QUERY_LIMITED_INFORMATION, False, pid)
+        if not handle:
+            return False
+        try:
+            exitCode = ctypes.c_ulong()
+            ctypes.windll.kernel32.GetExitCodeProcess(handle, ctypes.byref(exitCode))
+            return exitCode.value == STILL_ACTIVE
+        finally:
+            ctypes.windll.kernel32.CloseHandle(handle)
+
+    try:
+        os.kill(pid, 0)
+    except OSError as e:
+        # EPERM means that the process exists, but belongs to someone else
+        return e.errno == errno.EPERM
+    return True
+
+def getCommandLine(argv):
+    return " ".join( ('"%s"' % arg) if (" " in arg or not arg) else arg for arg in argv )
+
+class ProcessResult:
+    def __init__(self, argv, exitCode, output, duration, timedOut = False, startError = None):
+        self.argv = argv
+        self.exitCode = exitCode
+        self.output = output
+        self.duration = duration
+        self.timedOut = timedOut
+        # the reason why the process could not be started, if it could not be started
+        self.startError = startError
+
+# Stands in for a background process in dry run mode. Its output is taken from the replay
+# entry of the command, if there is one. Anything written to its stdin is discarded.
+class DryRunProcess:
+    def __init__(self, output = ""):
+        self.pid = 0
+        self.returncode = 0
+        self.stdin = io.BytesIO()
+        self.stdout = io.BytesIO(output.encode("utf-8"))
+
+    def poll(self):
+        return 0
+
+    def wait(self, timeout = None):
+        return 0
+
+    def terminate(self):
+        pass
+
+    def kill(self):
+        pass
+
+# Runs all external tools that bauer uses. Commands are always passed as argument lists,
+# never through a shell. Every call is timed and shows up in the profile (see profiler.py).
+#
+# For benchmarking bauer itself, the runner can record the calls and their output to a file
+# (BAUER_PROCESS_RECORD=FILE) and, in dry run mode (BAUER_PROCESS_DRY_RUN=1), skip running the
+# tools altogether. In dry run mode the exit codes and outputs are taken from a recording if one
+# is given with BAUER_PROCESS_REPLAY=FILE. Otherwise every call succeeds without output.
+class ProcessRunner:
+    def __init__(self):
+        self.logger = logging.getLogger(__name__)
+        self.lock = threading.Lock()
+        self.records = []
+
+        self.recordPath = os.environ.get("BAUER_PROCESS_RECORD")
+        self.dryRun = os.environ.get("BAUER_PROCESS_DRY_RUN", "") not in ("", "0")
+        self.replayEntries = None
+
+        replayPath = os.environ.get("BAUER_PROCESS_REPLAY")
+        if replayPath:
+            self.replayEntries = self.loadReplay(replayPath)
+
+    def loadReplay(self, path):
+        entries = {}
+        with open(path, "r") as f:
+            for line in f:
+                if line.strip():
+                    entry = json.loads(line)
+                    entries.setdefault( tuple(entry["argv"]), [] ).append(entry)
+        return entries
+
+    def getReplayEntry(self, argv):
+        if self.replayEntries is None:
+            return None
+
+        with self.lock:
+            entries = self.replayEntries.get(tuple(argv))
+            if not entries:
+                return None
+            # the same command can be called several times with different results
+            return entries.pop(0) if len(entries) > 1 else entries[0]
+
+    def addRecord(self, result, cwd, background = False):
+        record = {
+            "argv": result.argv,
+            "cwd": cwd,
+            "exitCode": result.exitCode,
+            "duration": result.duration,
+            "timedOut": result.timedOut }
+        if background:
+            record["background"] = True
+        if result.startError is not None:
+            record["startError"] = result.startError
+        if result.output is not None:
+            record["output"] = result.output
+
+        with self.lock:
+            self.records.append(record)
+
+            if self.recordPath:
+                with open(self.recordPath, "a") as f:
+                    f.write(json.dumps(record) + "\n")
+
+    # Runs a command and waits for it to finish.
+    #
+    # input:          text that is written to the stdin of the process
+    # stdout:         file (object or descriptor) that receives the output, if it is not captured
+    # stderr:         None (inherit) or STDOUT (merge into stdout)
+    # captureOutput:  collect the output and return it in ProcessResult.output
+    # outputCallback: called with every output line (without line ending) as soon as it is available
+    # timeout:        seconds after which the process is killed
+    #
+    # If the command cannot be started, then the exit code is EXIT_COMMAND_NOT_FOUND and
+    # ProcessResult.startError tells why. checkCall and checkOutput raise a ToolNotStartedError then.
+    def run(self, argv, cwd = None, env = None, timeout = None, input = None, stdout = None, stderr = None, captureOutput = False, outputCallback = None):
+        argv = [ str(arg) for arg in argv ]
+        self.logger.debug("Running: %s", getCommandLine(argv))
+
+        if self.dryRun:
+            replayEntry = self.getReplayEntry(argv) or {}
+            output = replayEntry.get("output", "") if captureOutput else None
+            result = ProcessResult(argv, replayEntry.get("exitCode", 0), output, 0.0, startError=replayEntry.get("startError"))
+            if outputCallback is not None:
+                for line in (replayEntry.get("output") or "").splitlines():
+                    outputCallback(line)
+            self.addRecord(result, cwd)
+            return result
+
+        pipeOutput = captureOutput or outputCallback is not None
+
+        startTime = time.time()
+        try:
+            proc = subprocess.Popen(
+                argv,
+                cwd=cwd,
+                env=env,
+                stdin=subprocess.PIPE if input is not None else None,
+                stdout=subprocess.PIPE if pipeOutput else stdout,
+                stderr=stderr)
+        except OSError as e:
+            self.logger.debug("Unable to start %s: %s", argv[0], e)
+            result = ProcessResult(argv, EXIT_COMMAND_NOT_FOUND, str(e) if captureOutput else None, time.time() - startTime, startError=str(e))
+            self.addRecord(result, cwd)
+            return result
+
+        timedOut = []
+        timer = None
+        if timeout is not None:
+            def killOnTimeout():
+                timedOut.append(True)
+                proc.kill()
+            timer = threading.Timer(timeout, killOnTimeout)
+            timer.daemon = True
+            timer.start()
+
+        try:
+            if input is not None:
+                # written from a separate thread, so that a process that produces a lot of output
+                # before it reads its input cannot block us
+                inputThread = threading.Thread(target=writeInput, args=(proc.stdin, input))
+                inputThread.daemon = True
+                inputThread.start()
+
+            outputLines = []
+            if pipeOutput:
+                for line in iter(proc.stdout.readline, b''):
+                    line = line.decode("utf-8", "replace")
+                    if captureOutput:
+                        outputLines.append(line)
+                    if outputCallback is not None:
+                        outputCallback(line.rstrip("\r\n"))
+                proc.stdout.close()
+
+            exitCode = proc.wait()
+        finally:
+            if timer is not None:
+                timer.cancel()
+
+        duration = time.time() - startTime
+        result = ProcessResult(argv, exitCode, "".join(outputLines) if captureOutput else None, duration, bool(timedOut))
+
+        self.addRecord(result, cwd)
+        profiler.addSpan(os.path.basename(argv[0]), startTime, duration, "process", { "argv": getCommandLine(argv), "exitCode": exitCode })
+
+        if result.timedOut:
+            self.logger.debug("%s timed out after %d seconds", argv[0], timeout)
+
+        return result
+
+    # Starts a command without waiting for it. If captureOutput is set, then the output of the
+    # process can be read from the stdout member of the returned Popen object. stderr is merged
+    # into it, unless stderr=None is passed (then it is inherited). If pipeInput is set, then the
+    # process reads its input from the stdin member.
+    # A detached process keeps running when bauer exits (see getDetachedProcessArguments).
+    # Its output is discarded. If processGroup is set, then the process gets a process group
+    # of its own (see killProcessGroup).
+    def start(self, argv, cwd = None, env = None, captureOutput = False, stderr = STDOUT, pipeInput = False, detach = False, processGroup = False):
+        argv = [ str(arg) for arg in argv ]
+        self.logger.debug("Starting: %s", getCommandLine(argv))
+
+        if self.dryRun:
+            replayEntry = self.getReplayEntry(argv) or {}
+            proc = DryRunProcess(replayEntry.get("output") or "")
+        elif detach:
+            with open(os.devnull, "r+b") as devnull:
+                proc = subprocess.Popen(argv, cwd=cwd, env=env, stdin=devnull, stdout=devnull, stderr=devnull, **getDetachedProcessArguments())
+        else:
+            popenArguments = getProcessGroupArguments() if processGroup else {}
+            if pipeInput:
+                popenArguments["stdin"] = subprocess.PIPE
+            if captureOutput:
+                proc = subprocess.Popen(argv, cwd=cwd, env=env, stdout=subprocess.PIPE, stderr=stderr, **popenArguments)
+            else:
+                proc = subprocess.Popen(argv, cwd=cwd, env=env, **popenArguments)
+
+        self.addRecord(ProcessResult(argv, None, None, 0.0), cwd, background=True)
+
+        return proc
+
+    def call(self, argv, **kwargs):
+        return self.run(argv, **kwargs).exitCode
+
+    # Like call, but raises a ToolFailedError if the command fails.
+    def checkCall(self, argv, **kwargs):
+        result = self.run(argv, **kwargs)
+        checkResult(result, kwargs.get("timeout"))
+        return result
+
+    # Returns the output of the command (stdout only, unless stderr=STDOUT is passed).
+    # Raises a ToolFailedError if the command fails.
+    def checkOutput(self, argv, **kwargs):
+        result = self.run(argv, captureOutput=True, **kwargs)
+        checkResult(result, kwargs.get("timeout"))
+        return result.output
+
+def writeInput(pipe, input):
+    try:
+        pipe.write(input.encode("utf-8"))
+        pipe.close()
+    except (IOError, OSError):
+        # the process exited without reading all of its input
+        pass
+
+def checkResult(result, timeout):
+    if result.startError is not None:
+        raise error.ToolNotStartedError(getCommandLine(result.argv), result.exitCode, result.startError)
+    if result.timedOut:
+        raise error.ToolTimedOutError(getCommandLine(result.argv), timeout)
+    if result.exitCode != 0:
+        raise error.ToolFailedError(getCommandLine(result.argv), result.exitCode)
+
+
+runner = ProcessRunner()
+
+def run(argv, **kwargs):
+    return runner.run(argv, **kwargs)
+
+def start(argv, **kwargs):
+    return runner.start(argv, **kwargs)
+
+def call(argv, **kwargs):
+    return runner.call(argv, **kwargs)
+
+def checkCall(argv, **kwargs):
+    return runner.checkCall(argv, **kwargs)
+
+def checkOutput(argv, **kwargs):
+    return runner.checkOutput(argv, **kwargs)
@@ -0,0 +1,141 @@
+import os
+import json
+import time
+import logging
+import threading
+import contextlib
+
+# Records how long the steps of a bauer command take. The results are written as a
+# Chrome trace-event file (open it with chrome://tracing or https://ui.perfetto.dev)
+# and summarized in a table.
+#
+# The profiler is a module level singleton, so that any module can add spans without
+# having to pass it around:
+#
+#   import profiler
+#   with profiler.span("configure"):
+#       ...
+#
+# When profiling is not enabled, spans cost next to nothing.
+class Profiler:
+    def __init__(self):
+        self.logger = logging.getLogger(__name__)
+        self.enabled = False
+        self.events = []
+        self.lock = threading.Lock()
+
+    def enable(self):
+        self.enabled = True
+
+    @contextlib.contextmanager
+    def span(self, name, category = "bauer", **args):
+        if not self.enabled:
+            yield
+            return
+
+        startTime = time.time()
+        try:
+            yield
+        finally:
+            self.addSpan(name, startTime, time.time() - startTime, category, args)
+
+    # Adds a span that has already been measured (times in seconds since the epoch).
+    def addSpan(self, name, startTime, duration, category = "bauer", args = None):
+        if not self.enabled:
+            return
+
+        event = {
+            "name": name,
+            "cat": category,
+            "ph": "X",
+            # wall clock time, so that the traces of several processes can be merged
+            "ts": int(startTime * 1000000),
+            "dur": int(duration * 1000000),
+            "pid": os.getpid(),
+            "tid": threading.current_thread().ident }
+        if args:
+            event["args"] = dict( (key, str(value)) for key, value in args.items() )
+
+        with self.lock:
+            self.events.append(event)
+
+    # Adds the events of a trace file written by another bauer process (see ParallelConfigurations).
+    def mergeTrace(self, path):
+        try:
+            with open(path, "r") as f:
+                events = json.load(f)["traceEvents"]
+        except (IOError, OSError, ValueError, KeyError) as e:
+            self.logger.debug("Unable to merge trace %s: %s", path, e)
+            return
+
+        with self.lock:
+            self.events += events
+
+    def writeTrace(self, path):
+        with self.lock:
+            events = list(self.events)
+
+        with open(path, "w") as f:
+            json.dump({ "traceEvents": events, "displayTimeUnit": "ms" }, f)
+
+    # Returns a text table with the number of calls, total and maximum duration per span name.
+    # Only the spans of this process are included.
+    def getSummary(self):
+        pid = os.getpid()
+        totals = {}
+        order = []
+
+        with self.lock:
+            for event in self.events:
+                if event["pid"] != pid:
+                    continue
+
+                name = event["name"]
+                if name not in totals:
+                    totals[name] = [0, 0, 0]
+                    order.append(name)
+
+                entry = totals[name]
+                entry[0] += 1
+                entry[1] += event["dur"]
+                entry[2] = max(entry[2], event["dur"])
+
+        nameWidth = max([ len(name) for name in order ] + [ len("Step") ])
+
+        lines = [ "%-*s %8s %12s %12s" % (nameWidth, "Step", "Calls", "Total (s)", "Max (s)") ]
+        for name in sorted(order, key=lambda name: -totals[name][1]):
+            calls, total, maximum = totals[name]
+            lines.append( "%-*s %8d %12.3f %12.3f" % (nameWidth, name, calls, total / 1000000.0, maximum / 1000000.0) )
+
+        return "\n".join(lines)
+
+    # Writes the trace to path and the summary table to path + ".txt".
+    def writeReport(self, path):
+        self.writeTrace(path)
+
+        summary = self.getSummary()
+        with open(path + ".txt", "w") as f:
+            f.write(summary + "\n")
+
+        self.logger.info("Profile written to %s\n%s", path, summary)
+
+
+profiler = Profiler()
+
+def enable():
+    profiler.enable()
+
+def isEnabled():
+    return profiler.enabled
+
+def span(name, category = "bauer", **args):
+    return profiler.span(name, category, **args)
+
+def addSpan(name, startTime, duration, category = "bauer", args = None):
+    profiler.addSpan(name, startTime, duration, category, args)
+
+def mergeTrace(path):
+    profiler.mergeTrace(path)
+
+def writeReport(path):
+    profiler.writeReport(path)
@@ -0,0 +1,79 @@
+# Startup budget of bauer: commands that do not need the build tools must not start any
+# process (no cmake, no sdkmanager, ...). Run with: python -m pytest bauer/tests
+import os, sys
+import shutil
+import logging
+import tempfile
+import unittest
+import subprocess
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.realpath(__file__)), ".."))
+
+import bauer
+import processrunner
+
+try:
+    from unittest import mock
+except ImportError:
+    import mock
+
+class StartupTest(unittest.TestCase):
+    def setUp(self):
+        self.spawned = []
+        self.workingDirectory = os.getcwd()
+        self.directory = tempfile.mkdtemp(prefix="bauer-startup-test-")
+        os.chdir(self.directory)
+
+        self.logHandlers = list(logging.getLogger().handlers)
+
+        patches = [ mock.patch.object(subprocess, "Popen", side_effect=self.recordSpawn) ]
+        for name in [ "run", "start", "call", "checkCall", "checkOutput" ]:
+            patches.append( mock.patch.object(processrunner.ProcessRunner, name, side_effect=self.recordSpawn, autospec=True) )
+
+        for patch in patches:
+            patch.start()
+            self.addCleanup(patch.stop)
+
+    def tearDown(self):
+        os.chdir(self.workingDirectory)
+        shutil.rmtree(self.directory, ignore_errors=True)
+
+        # bauer adds a log handler on every run
+        root = logging.getLogger()
+        for handler in list(root.handlers):
+            if handler not in self.logHandlers:
+                root.removeHandler(handler)
+
+    def recordSpawn(self, *args, **kwargs):
+        self.spawned.append(args)
+        raise AssertionError("Process started during startup: %s" % (args,))
+
+    def runBauer(self, arguments):
+        argv = [ "boden.py" ] + arguments
+        with mock.patch.object(sys, "argv", argv):
+            try:
+                exitCode = bauer.main(argv)
+            except SystemExit as e:
+                exitCode = e.code
+
+        self.assertEqual(self.spawned, [])
+        self.assertIn(exitCode, [ None, 0 ])
+
+    def test_help(self):
+        with mock.patch.object(sys, "stdout"):
+            self.runBauer([ "--help" ])
+
+    def test_build_help(self):
+        with mock.patch.object(sys, "stdout"):
+            self.runBauer([ "build", "--help" ])
+
+    def test_new(self):
+        self.runBauer([ "new", "-n", "startuptest" ])
+        self.assertTrue(os.path.isdir(os.path.join(self.directory, "startuptest")))
+
+    def test_distclean(self):
+        os.makedirs(os.path.join(self.directory, "build"))
+        self.runBauer([ "distclean" ])
+
+if __name__ == "__main__":
+    unittest.main()